@@ -0,0 +1,145 @@
+import argparse
+import hashlib
+import json
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.fixture_server import FixtureServer, load_corpus
+from gather_webpages import worker_task
+from utils.crawl_pipeline import CrawlPipeline
+from utils.document_store import DocumentStore, decode_document
+from utils.politeness import PolitenessScheduler
+
+
+def timed_worker_task(args):
+    """gather_webpages.worker_task plus the CPU seconds it spent in the worker."""
+    started = time.process_time()
+    result = worker_task(args)
+    return time.process_time() - started, result
+
+
+def record_corpus(urls_file, corpus_dir):
+    """Downloads the URLs listed in `urls_file` (one per line) into `corpus_dir`."""
+    from utils.crawler import get_pages
+
+    with open(urls_file, "r") as fp:
+        urls = [line.strip() for line in fp if line.strip()]
+    os.makedirs(corpus_dir, exist_ok=True)
+    pages = get_pages(urls, use_selenium=False)
+    saved = 0
+    for url, html in pages.items():
+        if html:
+            name = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+            with open(os.path.join(corpus_dir, f"{name}.html"), "w", encoding="utf-8") as fp:
+                fp.write(html)
+            saved += 1
+    print(f"Recorded {saved}/{len(urls)} pages into {corpus_dir}")
+
+
+def run_benchmark(args):
+    corpus = load_corpus(args.corpus, args.synthetic_pages)
+    cpu_seconds = []
+    stored = []
+    extract_failures = []
+    empty_pages = []
+
+    with FixtureServer(
+        corpus,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        slow_rate=args.slow_rate,
+        slow_seconds=args.slow_seconds,
+        seed=args.seed,
+    ) as server, tempfile.TemporaryDirectory() as store_dir:
+        store = DocumentStore(store_dir)
+        urls = server.urls() * args.repeat
+        tasks = [(url, f"doc_{i}") for i, url in enumerate(urls)]
+
+        def on_result(timed_result):
+            seconds, (success, url, doc_id, payload, fingerprint) = timed_result
+            cpu_seconds.append(seconds)
+            if not success:
+                extract_failures.append(doc_id)
+            elif not decode_document(payload):
+                # Extraction found no content; a stored empty page is not a crawled page.
+                empty_pages.append(doc_id)
+            else:
+                store.put(doc_id, payload=payload, commit=False)
+                stored.append(doc_id)
+
+        pipeline = CrawlPipeline(
+            timed_worker_task,
+            fetch_concurrency=args.fetch_concurrency,
+            extract_workers=args.extract_workers,
+            use_selenium=False,
+            report_every=3600,
+            max_per_host=args.fetch_concurrency,
+            scheduler=PolitenessScheduler(rate=args.host_rate, max_rate=args.host_rate * 4) if args.polite else None,
+        )
+        started = time.monotonic()
+        pipeline.run(tasks, on_result=on_result)
+        wall_seconds = time.monotonic() - started
+        store.close()
+
+    fetch = pipeline.stats["fetch"]
+    extract = pipeline.stats["extract"]
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    report = {
+        "pages": len(tasks),
+        "stored": len(stored),
+        "fetch_failures": fetch.failed,
+        "not_fetched": len(pipeline.not_fetched),
+        "extract_failures": len(extract_failures),
+        "empty_pages": len(empty_pages),
+        "wall_seconds": round(wall_seconds, 3),
+        "pages_per_second": round(len(stored) / wall_seconds, 2),
+        "fetch_latency_p50": round(fetch.percentile(50), 4),
+        "fetch_latency_p95": round(fetch.percentile(95), 4),
+        "fetch_latency_p99": round(fetch.percentile(99), 4),
+        "extract_latency_p50": round(extract.percentile(50), 4),
+        "extract_latency_p99": round(extract.percentile(99), 4),
+        "extract_cpu_seconds": round(sum(cpu_seconds), 3),
+        "extract_cpu_ms_per_page": round(1000 * sum(cpu_seconds) / max(len(cpu_seconds), 1), 2),
+        # ru_maxrss is reported in kilobytes on Linux.
+        "peak_rss_main_mb": round(self_usage.ru_maxrss / 1024, 1),
+        "peak_rss_worker_mb": round(child_usage.ru_maxrss / 1024, 1),
+    }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline crawl-and-extract benchmark against a local fixture web server. "
+                    "Run from the repository root: python -m benchmarks.crawl_benchmark"
+    )
+    parser.add_argument("--corpus", default="benchmarks/corpus", help="Folder of recorded .html pages.")
+    parser.add_argument("--synthetic-pages", type=int, default=500, help="Generated pages when no corpus exists.")
+    parser.add_argument("--record", metavar="URLS_FILE", help="Record the listed URLs into --corpus and exit.")
+    parser.add_argument("--repeat", type=int, default=1, help="Serve the corpus this many times.")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=25)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fetch-concurrency", type=int, default=256)
+    parser.add_argument("--extract-workers", type=int, default=None)
+    parser.add_argument("--polite", action="store_true", help="Enable the per-host politeness scheduler.")
+    parser.add_argument("--host-rate", type=float, default=50.0, help="Requests/s for the fixture host with --polite.")
+    parser.add_argument("--output", help="Also write the report as JSON to this file.")
+    args = parser.parse_args()
+
+    if args.record:
+        record_corpus(args.record, args.corpus)
+    else:
+        report = run_benchmark(args)
+        print(json.dumps(report, indent=4))
+        if args.output:
+            with open(args.output, "w") as fp:
+                json.dump(report, fp, indent=4)
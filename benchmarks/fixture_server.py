@@ -0,0 +1,160 @@
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+SYNTHETIC_PARAGRAPH = (
+    "State officials said on Tuesday that the budget shortfall reached {n} billion dollars in {year}, "
+    "according to figures released by the legislative analyst's office. Critics of the governor argued "
+    "that the number had been misrepresented in several widely shared social media posts, while "
+    "supporters pointed to revenue forecasts published earlier in the year. "
+)
+
+
+def synthetic_page(index, paragraphs=30):
+    """Deterministic news-like article used when no recorded corpus is available."""
+    rng = random.Random(index)
+    body = "".join(
+        f"<p>{SYNTHETIC_PARAGRAPH.format(n=rng.randint(1, 90), year=rng.randint(2000, 2024))}</p>\n"
+        for _ in range(paragraphs)
+    )
+    return (
+        f"<html><head><title>Fixture article {index}</title>"
+        f'<meta name="author" content="Fixture Author"><meta name="date" content="2022-01-{index % 28 + 1:02d}">'
+        f"</head><body><nav>Home | World | Politics</nav><article><h1>Fixture article {index}</h1>\n"
+        f"{body}</article><footer>Copyright fixture</footer></body></html>"
+    )
+
+
+def load_corpus(corpus_dir=None, synthetic_pages=500):
+    """
+    Returns {name: html}. Recorded pages are read from `corpus_dir` (one .html file
+    per page); without a corpus, `synthetic_pages` generated articles are served.
+    """
+    if corpus_dir and os.path.isdir(corpus_dir):
+        corpus = {}
+        for name in sorted(os.listdir(corpus_dir)):
+            if name.endswith(".html"):
+                with open(os.path.join(corpus_dir, name), "r", encoding="utf-8", errors="replace") as fp:
+                    corpus[name[:-len(".html")]] = fp.read()
+        if corpus:
+            return corpus
+    return {f"page_{i}": synthetic_page(i) for i in range(synthetic_pages)}
+
+
+class FixtureServer:
+    def __init__(
+        self,
+        corpus,
+        host="127.0.0.1",
+        port=0,
+        latency_ms=50,
+        jitter_ms=25,
+        error_rate=0.0,
+        throttle_rate=0.0,
+        slow_rate=0.0,
+        slow_seconds=2.0,
+        seed=0,
+    ):
+        """
+        Local HTTP server serving a page corpus with injected faults.
+
+        Pages are served at /<name>. Each request waits `latency_ms` ± `jitter_ms`
+        before answering; a fraction of requests fails with 500 (`error_rate`) or
+        429 with Retry-After (`throttle_rate`), and a fraction is dribbled out in
+        small chunks over `slow_seconds` (`slow_rate`). Fault decisions come from
+        a seeded generator, so runs with the same settings are reproducible.
+
+        Args:
+            corpus (dict): Mapping of page name -> html.
+            host (str): Interface to bind.
+            port (int): Port to bind; 0 picks a free port.
+            latency_ms (float): Mean added response latency.
+            jitter_ms (float): Uniform jitter around the latency.
+            error_rate (float): Fraction of requests answered with 500.
+            throttle_rate (float): Fraction of requests answered with 429.
+            slow_rate (float): Fraction of responses sent slowly.
+            slow_seconds (float): Duration over which a slow response is sent.
+            seed (int): Seed for the fault generator.
+        """
+        self.corpus = corpus
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self):
+        return [f"{self.base_url}/{name}" for name in self.corpus]
+
+    def _roll(self):
+        with self.rng_lock:
+            return self.rng.random(), self.rng.random(), self.rng.uniform(-1, 1)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fault, slow, jitter = server._roll()
+                time.sleep(max(0.0, server.latency_ms + jitter * server.jitter_ms) / 1000)
+                html = server.corpus.get(self.path.lstrip("/").split("?")[0])
+                if html is None:
+                    return self._send(404, b"not found", "text/plain")
+                if fault < server.throttle_rate:
+                    return self._send(429, b"slow down", "text/plain", {"Retry-After": "1"})
+                if fault < server.throttle_rate + server.error_rate:
+                    return self._send(500, b"server error", "text/plain")
+                body = html.encode("utf-8")
+                if slow < server.slow_rate:
+                    return self._send(200, body, "text/html; charset=utf-8", chunks=20)
+                self._send(200, body, "text/html; charset=utf-8")
+
+            def _send(self, status, body, content_type, headers=None, chunks=1):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                step = max(1, len(body) // chunks)
+                for start in range(0, len(body), step):
+                    self.wfile.write(body[start:start + step])
+                    if chunks > 1:
+                        self.wfile.flush()
+                        time.sleep(server.slow_seconds / chunks)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
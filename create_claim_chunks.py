@@ -1,17 +1,23 @@
 import sqlite3
 import json
 import os
-import re
 from tqdm import tqdm
 import logging
 import uuid
+import hashlib
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings  # Updated Import
 from langchain_community.vectorstores import Qdrant  # Updated Import
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import VectorParams, Distance
 
+from utils.chunking import iter_chunks
+from utils.document_store import DocumentStore, load_document
+from utils.embedding_cache import EmbeddingCache
+from utils.embeddings import LazyEmbeddings, load_embeddings, load_parity
+from utils.search_results import find_search_results, iter_search_results
+from utils.sparse_index import BM25Index
+from utils.vector_store import VectorStore, QdrantVectorStore, LocalVectorStore
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,  # Set to DEBUG for more detailed logs
@@ -21,10 +27,45 @@ logging.basicConfig(
     ]
 )
 logger = logging.getLogger(__name__)
-global text_splitter
 global embedding_model
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
-embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Chunks gathered across documents and claims before they are embedded and
+# upserted together, the size of one model call and of one Qdrant request.
+FLUSH_SIZE = 4096
+EMBED_BATCH_SIZE = 256
+UPSERT_BATCH_SIZE = 1024
+# Namespace for deterministic chunk ids; changing it re-keys the whole collection.
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1c2a4e-9b0d-5c3e-8a7f-2d4b6e8f0a1c")
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+EMBEDDING_CACHE_DIR = "outputs/embedding_cache"
+# "torch" runs the sentence-transformers model; "onnx" runs the int8-quantized
+# export in ONNX_MODEL_DIR (see `python -m utils.embeddings export`) spread over
+# EMBEDDING_PROCESSES worker processes.
+EMBEDDING_BACKEND = "torch"
+ONNX_MODEL_DIR = "outputs/onnx/all-MiniLM-L6-v2"
+EMBEDDING_PROCESSES = max((os.cpu_count() or 2) - 1, 1)
+# When `python -m utils.embedding_service` listens here and serves the same
+# model, backend and dimension, embeddings are requested from it instead of
+# loading a model copy.
+EMBEDDING_SERVICE_SOCKET = "outputs/embedding.sock"
+# "qdrant" stores chunks on the Qdrant server; "local" uses the embedded exact
+# index in LOCAL_VECTOR_STORE_DIR, which needs no running server.
+VECTOR_STORE_BACKEND = "qdrant"
+LOCAL_VECTOR_STORE_DIR = "outputs/vector_store"
+# BM25 index built next to the vectors for hybrid retrieval; None disables it.
+SPARSE_INDEX_DIR = "outputs/sparse_index"
+
+# Built on first use, not at import.
+embedding_model = LazyEmbeddings(
+    load_embeddings,
+    backend=EMBEDDING_BACKEND,
+    model_name=EMBEDDING_MODEL_NAME,
+    onnx_dir=ONNX_MODEL_DIR,
+    processes=EMBEDDING_PROCESSES,
+    batch_size=EMBED_BATCH_SIZE,
+    service_socket=EMBEDDING_SERVICE_SOCKET,
+    dim=EMBEDDING_DIM,
+)
 
 
 def initialize_qdrant(
@@ -86,134 +127,323 @@ def initialize_qdrant(
         logger.error(f"Failed to initialize Qdrant: {e}")
         raise e
 
-def get_file_path(key: str, db_path: str = "outputs/index.db") -> str:
+def initialize_vector_store(backend: str = VECTOR_STORE_BACKEND, collection_name: str = "fact_checking") -> VectorStore:
+    """
+    Opens the vector store chunks are written to.
+
+    Args:
+        backend (str): "qdrant" for the Qdrant server at localhost:6333, or "local"
+                       for the embedded index in LOCAL_VECTOR_STORE_DIR.
+        collection_name (str): Qdrant collection, or subdirectory of the local index.
+
+    Returns:
+        VectorStore: A store with the same add/search calls for either backend.
     """
-    Retrieves the file path from the SQLite database based on the provided key.
+    if backend == "qdrant":
+        qdrant_vectorstore = initialize_qdrant(
+            host="localhost",
+            port=6333,
+            collection_name=collection_name,
+            vector_size=EMBEDDING_DIM,  # Dimensionality of 'sentence-transformers/all-MiniLM-L6-v2'
+            distance_metric="Cosine"  # Choose based on your similarity requirements
+        )
+        vectorstore = QdrantVectorStore(
+            qdrant_vectorstore.client, collection_name, embedding_model, batch_size=UPSERT_BATCH_SIZE
+        )
+        # Indexed before ingestion so claim-filtered searches never scan the collection.
+        vectorstore.ensure_payload_indexes()
+        return vectorstore
+    if backend == "local":
+        root = os.path.join(LOCAL_VECTOR_STORE_DIR, collection_name)
+        logger.info(f"Using local vector store at {root}.")
+        return LocalVectorStore(root, embedding_model, EMBEDDING_DIM)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+def load_index_mapping(db_path: str = "outputs/index.db") -> dict:
+    """
+    Loads the whole key -> path mapping of the index with a single query.
 
     Args:
-        key (str): The unique key to search for in the database.
         db_path (str): Path to the SQLite database file.
 
     Returns:
-        str: The file path associated with the key, or None if not found.
+        dict: {key: path} for every row of index_table.
     """
+    conn = sqlite3.connect(db_path)
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT path FROM index_table WHERE key = ?", (key,))
-        result = cursor.fetchone()
+        return dict(conn.execute("SELECT key, path FROM index_table"))
+    finally:
         conn.close()
-        if result:
-            return result[0]
-        else:
-            logger.warning(f"No path found for key: {key}")
-            return None
-    except Exception as e:
-        logger.error(f"Unexpected Error for key '{key}': {e}")
-        return None
 
-def clean_text(text: str) -> str:
+def resolve_claim_documents(search_results, db_path: str = "outputs/index.db"):
     """
-    Cleans the input text by removing unwanted characters and formatting.
+    Resolves the result keys of every claim to document paths in bulk.
 
     Args:
-        text (str): The raw text to clean.
+        search_results (Iterable): (claim, {query: {page_num: [result, ...]}}) pairs.
+        db_path (str): Path to the SQLite database file.
 
-    Returns:
-        str: The cleaned text.
+    Yields:
+        tuple: (claim_index, claim, paths) where paths lists the claim's documents
+               once each, in search result order.
+    """
+    mapping = load_index_mapping(db_path)
+    logger.info(f"Loaded {len(mapping)} index entries from {db_path}.")
+    for claim_index, (claim, queries) in enumerate(search_results):
+        paths = []
+        seen = set()
+        for query_index, (query, page_results) in enumerate(queries.items()):
+            for page_num, results in page_results.items():
+                for webpage_index, result_object in enumerate(results):
+                    key = f"{claim_index}-{query_index}-{page_num}-{webpage_index}"
+                    path = mapping.get(key)
+                    if path is None:
+                        logger.warning(f"No path found for key: {key}")
+                    elif path not in seen:
+                        # Keys of one claim often resolve to the same (deduplicated)
+                        # document; each document is embedded once per claim.
+                        seen.add(path)
+                        paths.append(path)
+        yield claim_index, claim, paths
+
+class ChunkBatcher:
+    def __init__(
+        self,
+        vectorstore: VectorStore,
+        flush_size: int = FLUSH_SIZE,
+        embed_batch_size: int = EMBED_BATCH_SIZE,
+        upsert_batch_size: int = UPSERT_BATCH_SIZE,
+        embedding_cache: EmbeddingCache = None,
+        sparse_index: BM25Index = None,
+    ):
+        """
+        Collects chunks across documents and claims and embeds and stores them
+        in large batches.
+
+        Buffered chunks are sorted by length before embedding so each model
+        batch holds similarly sized texts with little padding, and points are
+        upserted in bulk rather than one request per document.
+
+        Args:
+            vectorstore (VectorStore): The Qdrant or local vector store.
+            flush_size (int): Number of buffered chunks that triggers a flush.
+            embed_batch_size (int): Chunks per embedding call.
+            upsert_batch_size (int): Points per upsert call.
+            embedding_cache (EmbeddingCache, optional): Persistent cache consulted before
+                                                        the model; only misses are embedded.
+            sparse_index (BM25Index, optional): BM25 index kept in step with the vector store.
+        """
+        self.vectorstore = vectorstore
+        self.flush_size = flush_size
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.embedding_cache = embedding_cache
+        self.sparse_index = sparse_index
+        self.texts = []
+        self.metadatas = []
+        self.ids = []
+        self.documents = {}
+        self.total_stored = 0
+        self.total_skipped = 0
+
+    def add(self, texts: list, metadatas: list, ids: list, claim_id=None, document_id: str = None):
+        """
+        Queues the chunks of one document for a claim. When claim_id and
+        document_id are given, points of that pair whose ids are not in `ids`
+        are deleted at the next flush, so a changed document leaves no stale
+        chunks behind.
+        """
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        self.ids.extend(ids)
+        if document_id is not None:
+            self.documents.setdefault((claim_id, document_id), []).extend(ids)
+        if len(self.texts) >= self.flush_size:
+            self.flush()
+
+    def embed(self, texts: list) -> list:
+        """
+        Embeds texts in length-sorted batches, returning vectors in input order.
+        Cached texts and repeats within the buffer are not sent to the model.
+        """
+        if self.embedding_cache is not None:
+            vectors = self.embedding_cache.get_many(texts)
+        else:
+            vectors = [None] * len(texts)
+        first_index = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                first_index.setdefault(texts[i], i)
+        order = sorted(first_index.values(), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), self.embed_batch_size):
+            batch = order[start:start + self.embed_batch_size]
+            batch_texts = [texts[i] for i in batch]
+            embedded = self.vectorstore.embeddings.embed_documents(batch_texts)
+            for i, vector in zip(batch, embedded):
+                vectors[i] = vector
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many(batch_texts, embedded)
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                vectors[i] = vectors[first_index[texts[i]]]
+        return vectors
+
+    def flush(self):
+        # Documents without chunks still need their stale points deleted.
+        if not self.texts and not self.documents:
+            return
+        texts, metadatas, ids, documents = self.texts, self.metadatas, self.ids, self.documents
+        self.texts, self.metadatas, self.ids, self.documents = [], [], [], {}
+        try:
+            if self.sparse_index is not None:
+                # Checked separately so an index added after earlier runs fills
+                # up with chunks the vector store already holds.
+                indexed = self.sparse_index.existing_ids(ids)
+                missing = [i for i, point_id in enumerate(ids) if point_id not in indexed]
+                self.sparse_index.add(
+                    [ids[i] for i in missing], [texts[i] for i in missing], [metadatas[i] for i in missing]
+                )
+            # Ids are deterministic, so points stored by an earlier run are
+            # skipped before any embedding work is done.
+            existing = self.vectorstore.existing_ids(ids)
+            if existing:
+                keep = [i for i, point_id in enumerate(ids) if point_id not in existing]
+                self.total_skipped += len(ids) - len(keep)
+                texts = [texts[i] for i in keep]
+                metadatas = [metadatas[i] for i in keep]
+                ids = [ids[i] for i in keep]
+            vectors = self.embed(texts)
+            for start in range(0, len(ids), self.upsert_batch_size):
+                end = start + self.upsert_batch_size
+                self.vectorstore.upsert(ids[start:end], vectors[start:end], texts[start:end], metadatas[start:end])
+            # Stale chunks go only after their replacements are stored.
+            self.vectorstore.delete_stale(documents)
+            if self.sparse_index is not None:
+                self.sparse_index.delete_stale(documents)
+            self.total_stored += len(ids)
+            logger.info(
+                f"Successfully inserted {len(ids)} vectors ({self.total_stored} total, "
+                f"{self.total_skipped} already stored)."
+            )
+            if self.embedding_cache is not None:
+                logger.info(
+                    f"Embedding cache: {self.embedding_cache.hits} hits, {self.embedding_cache.misses} misses."
+                )
+        except Exception as e:
+            logger.error(f"Error inserting a batch of {len(texts)} vectors: {e}")
+
+
+def chunk_id(claim_id, document_id: str, chunk_number: int, text: str) -> str:
     """
-    text = text.replace("\n", " ").replace("\r", " ")
-    text = re.sub(r'<[^>]+>', '', text)  # Remove HTML tags
-    text = re.sub(r'\s+', ' ', text)     # Replace multiple whitespace with single space
-    text = text.strip()
-    return text
+    Deterministic point id of a chunk: the same claim, document, position and
+    content always map to the same id, so re-ingestion overwrites instead of
+    duplicating.
+    """
+    content_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{claim_id}|{document_id}|{chunk_number}|{content_hash}"))
+
 
-def process_and_store_claim_chunks(claim_id: str, document_json: dict, qdrant_vectorstore: Qdrant):
+def process_and_store_claim_chunks(claim_id: str, document_json: dict, batcher: ChunkBatcher, document_id: str = None):
     """
-    Processes the document text, splits it into chunks, generates embeddings,
-    and stores them in Qdrant.
+    Processes the document text, splits it into chunks and queues them for
+    batched embedding and storage in the vector store.
 
     Args:
         claim_id (str): The identifier for the claim.
         document_json (dict): The document containing 'hostname' and 'text'.
-        qdrant_vectorstore (Qdrant): The initialized Qdrant vector store.
+        batcher (ChunkBatcher): Collects chunks across documents for embedding.
+        document_id (str, optional): Identity of the document, e.g. its document store id.
+                                     Defaults to the document's URL.
     """
     hostname = document_json["hostname"]
-    text = document_json["text"]
-    cleaned_text = clean_text(text)
-    chunks = text_splitter.split_text(cleaned_text)
+    document_id = document_id or document_json.get("source") or document_json.get("url") or hostname
+    # Window and overlap sizes are the defaults of utils.chunking.
+    chunks = list(iter_chunks(document_json["text"]))
 
     # Prepare texts, metadatas, and ids
-    texts = chunks
+    texts = [chunk.text for chunk in chunks]
     metadatas = [
         {
             "claim_id": claim_id,
             "source": hostname,
-            "chunk_number": chunk_number
-        } for chunk_number in range(len(chunks))
+            "document_id": document_id,
+            "chunk_number": chunk_number,
+            # Character span of the chunk in the document's "text" field.
+            "start": chunk.start,
+            "end": chunk.end,
+        } for chunk_number, chunk in enumerate(chunks)
     ]
-    ids = [str(uuid.uuid4()) for _ in range(len(chunks))]
+    ids = [chunk_id(claim_id, document_id, chunk_number, text) for chunk_number, text in enumerate(texts)]
 
-    
-    try:
-        qdrant_vectorstore.add_texts(
-            texts=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
-        logger.info(f"Successfully inserted {len(texts)} vectors for claim '{claim_id}'.")
-    except Exception as e:
-        logger.error(f"Error inserting vectors for claim '{claim_id}': {e}")
+    batcher.add(texts, metadatas, ids, claim_id=claim_id, document_id=document_id)
 
 
 def main():
+    if EMBEDDING_BACKEND == "onnx":
+        # Quantized vectors must stay interchangeable with the reference model's.
+        # The check runs once per export, not on every ingest.
+        parity = load_parity(ONNX_MODEL_DIR, EMBEDDING_MODEL_NAME)
+        if parity is None:
+            logger.error(
+                f"The ONNX export in {ONNX_MODEL_DIR} has no parity result; run "
+                "`python -m utils.embeddings parity` (or `export`) first."
+            )
+            return
+        logger.info(f"Embedding parity of '{EMBEDDING_BACKEND}' backend: {parity}")
+        if not parity["passed"]:
+            logger.error("Embedding backend does not match the reference model; aborting.")
+            return
 
-    # Initialize Qdrant vector store
-    qdrant_vectorstore = initialize_qdrant(
-        host="localhost",
-        port=6333,
-        collection_name="fact_checking",
-        vector_size=384,  # Dimensionality of 'sentence-transformers/all-MiniLM-L6-v2'
-        distance_metric="Cosine"  # Choose based on your similarity requirements
-    )
+    vectorstore = initialize_vector_store(VECTOR_STORE_BACKEND, collection_name="fact_checking")
     # Load search results
-    search_results_path = "outputs/search_results.json"
+    search_results_path = find_search_results("outputs")
     if not os.path.exists(search_results_path):
         logger.error(f"Search results file not found at path: {search_results_path}")
         return
 
-    with open(search_results_path, "r") as fp:
-        try:
-            search_results = json.load(fp)
-            logger.info(f"Loaded search results from {search_results_path}.")
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON from {search_results_path}: {e}")
-            return
+    # Claims are read lazily, one at a time.
+    search_results = iter_search_results(search_results_path)
+    logger.info(f"Streaming search results from {search_results_path}.")
 
-    document_folder = "outputs/documents"
-    os.makedirs(document_folder, exist_ok=True)
+    # Documents written by gather_webpages; unmigrated per-page JSON files are
+    # still read directly.
+    document_store_path = "outputs/document_store"
+    store = DocumentStore(document_store_path, readonly=True) if os.path.exists(document_store_path) else None
+
+    batcher = ChunkBatcher(
+        vectorstore,
+        # Backends produce slightly different vectors, so each has its own cache.
+        embedding_cache=EmbeddingCache(
+            EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL_NAME}-{EMBEDDING_BACKEND}",
+            EMBEDDING_DIM,
+            EMBEDDING_CACHE_DIR,
+        ),
+        sparse_index=BM25Index(os.path.join(SPARSE_INDEX_DIR, "fact_checking")) if SPARSE_INDEX_DIR else None,
+    )
 
     # Process each claim
-    for claim_index, (claim, queries) in enumerate(tqdm(search_results.items())):
-        for query_index, (query, page_results) in enumerate(queries.items()):
-            for page_num, results in page_results.items():
-                for webpage_index, result_object in enumerate(results):
-                    key = f"{claim_index}-{query_index}-{page_num}-{webpage_index}"
-                    file_path = get_file_path(key)
-                    if file_path and os.path.exists(file_path):
-                        try:
-                            with open(file_path, "r") as fp:
-                                document_json = json.load(fp)
-                                if document_json:
-                                    process_and_store_claim_chunks(claim_index, document_json, qdrant_vectorstore)
-                                else:
-                                    logger.warning(f"Empty JSON found for key: {key}, file: {file_path}")
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Error decoding JSON from file {file_path}: {e}")
-                        except Exception as e:
-                            logger.error(f"Error processing file {file_path} for key {key}: {e}")
-                    else:
-                        logger.warning(f"File path not found or does not exist for key: {key}, path: {file_path}")
+    for claim_index, claim, file_paths in tqdm(resolve_claim_documents(search_results)):
+        for file_path in file_paths:
+            try:
+                document_json = load_document(store, file_path)
+                if document_json is None:
+                    logger.warning(f"Document does not exist for claim {claim_index}, path: {file_path}")
+                elif document_json:
+                    process_and_store_claim_chunks(claim_index, document_json, batcher, document_id=file_path)
+                else:
+                    logger.warning(f"Empty JSON found for claim {claim_index}, file: {file_path}")
+            except json.JSONDecodeError as e:
+                logger.error(f"Error decoding JSON from file {file_path}: {e}")
+            except Exception as e:
+                logger.error(f"Error processing file {file_path} for claim {claim_index}: {e}")
+
+    batcher.flush()
+    if store is not None:
+        store.close()
+    if batcher.sparse_index is not None:
+        batcher.sparse_index.close()
+    if isinstance(vectorstore, LocalVectorStore):
+        vectorstore.close()
 
 if __name__ == "__main__":
     main()
@@ -11,11 +11,16 @@ import threading
 
 import time
 
+from utils.gemini_interface import QUOTA_ERROR, classify_error, is_daily_quota_error
+from utils.quota_ledger import QuotaLedger
+
 
 # Constants for rate limiting
 REQUESTS_PER_MINUTE = 15
 REQUESTS_PER_DAY = 1500
-SECONDS_PER_REQUEST = 60 / REQUESTS_PER_MINUTE  # 4 seconds
+TOKENS_PER_MINUTE = 1_000_000
+# Usage per key shared with GeminiAPI and other processes on this node.
+QUOTA_LEDGER_PATH = "outputs/quota_ledger.db"
 
 def load_api_keys(secrets_file: str) -> List[str]:
     with open(secrets_file, "r") as f:
@@ -71,10 +76,23 @@ def worker_process(task_queue: Queue, output_queue: Queue, api_key: str, prompt_
         }
     )
     
+    ledger = QuotaLedger(QUOTA_LEDGER_PATH)
+
     while True: 
         record = task_queue.get()
         if record == "DONE":
             break
+
+        # Wait for room in this key's quota, as counted by every process and earlier runs.
+        wait = ledger.reserve(api_key, REQUESTS_PER_MINUTE, REQUESTS_PER_DAY, TOKENS_PER_MINUTE)
+        while 0 < wait < float("inf"):
+            time.sleep(wait)
+            wait = ledger.reserve(api_key, REQUESTS_PER_MINUTE, REQUESTS_PER_DAY, TOKENS_PER_MINUTE)
+        if wait == float("inf"):
+            # The record is not saved, so the next run picks it up again; the
+            # other workers keep draining the queue while their keys have quota.
+            print(f"{current_process().name}: daily quota of key ****{api_key[-5:]} used up, stopping.")
+            break
         
         record['justification'] = None
         record['claim_author'] = None
@@ -101,18 +119,26 @@ def worker_process(task_queue: Queue, output_queue: Queue, api_key: str, prompt_
             )
                 
             )
+            usage = getattr(response, "usage_metadata", None)
+            ledger.record_tokens(api_key, getattr(usage, "total_token_count", 0) if usage else 0)
             resp = json.loads(response.text)
             record['justification'] = resp.get("Summary", None)
             record['claim_author'] = resp.get("Claim Author", None)
             record['claim_date'] = resp.get("Claim Date", None)
             output_queue.put(record)
             
-            time.sleep(SECONDS_PER_REQUEST)
-            
         except Exception as e:
+            if classify_error(e) == QUOTA_ERROR and is_daily_quota_error(e):
+                # Record the exhausted quota so that other processes and later
+                # runs skip this key; like above, the record is left for the next run.
+                ledger.exhaust(api_key, REQUESTS_PER_DAY)
+                print(f"{current_process().name}: daily quota of key ****{api_key[-5:]} used up, stopping.")
+                break
             print(f"{current_process().name}: Error processing claim at {record["claim"]}: {record['claim']}... Error: {e}")
             output_queue.put(record)
 
+    ledger.close()
+
 
 def monitor_progress(processed_count, total, lock):
     """Function to monitor and update the progress bar."""
@@ -186,6 +212,12 @@ def main():
     
     output_queue.put("DONE")
     saver.join()
+    if processed_count.value < total_claims:
+        # Workers that ran out of quota leave records in the task queue. They
+        # are not saved, so the next run processes them; do not wait at exit
+        # for the queue to hand them to a reader that no longer exists.
+        task_queue.cancel_join_thread()
+        print(f"Stopped with {total_claims - processed_count.value} claims left for the next run.")
     print("Processing completed.")
 
 if __name__ == "__main__":
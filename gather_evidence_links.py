@@ -4,12 +4,19 @@ from nltk import pos_tag, word_tokenize
 from tqdm import tqdm
 import pandas as pd
 from utils.gemini_interface import GeminiAPI
+from utils.question_generation import BATCH_RESPONSE_SCHEMA, BatchQuestionGenerator, response_text
+from utils.rate_limiter import QuotaExhaustedError
 from utils.google_customsearch import GoogleCustomSearch
 from utils.bing_customsearch import BingCustomSearch
+from utils.search_results import SearchResultsWriter, completed_claims
 import datetime
 import random
 
 
+# Claims packed into one question generation request; 1 sends one request per claim.
+QUESTION_BATCH_SIZE = 8
+
+
 def string_to_search_query(text, author):
     parts = word_tokenize(text.strip())
     tags = pos_tag(parts)
@@ -29,6 +36,31 @@ def string_to_search_query(text, author):
     return search_string
 
 
+def parse_question_text(text):
+    """Questions in the text of a single-claim response, or None if the JSON is malformed."""
+    try:
+        questions = json.loads(text)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    return questions if isinstance(questions, list) else None
+
+
+def parse_questions(response):
+    """Questions of a single-claim response, or None if the request failed or the JSON is malformed."""
+    return parse_question_text(response_text(response))
+
+
+def stop_on_exhausted_quota(questions_per_claim):
+    """
+    Yields the questions per claim until every API key is out of daily quota,
+    then stops cleanly; claims searched so far are already stored.
+    """
+    try:
+        yield from questions_per_claim
+    except QuotaExhaustedError as e:
+        print(f"Stopping early: {e} The remaining claims are picked up by the next run.")
+
+
 # Write a function to create an folder called outputs
 def create_output_folder(folder_name):
     if not os.path.exists(folder_name):
@@ -89,25 +121,58 @@ if __name__ == "__main__":
     # bing_search = BingCustomSearch(max_api_calls_per_account, n_pages)
 
     # # Gemini Flash 1.5 Interface 
-    gemini_flash_api = GeminiAPI(model_name="gemini-1.5-flash-latest", secrets_file="./secrets/gemini_keys.json", response_mime_type="application/json", response_schema=response_schema_questions)
+    gemini_flash_api = GeminiAPI(
+        model_name="gemini-1.5-flash-latest",
+        secrets_file="./secrets/gemini_keys.json",
+        response_mime_type="application/json",
+        response_schema=BATCH_RESPONSE_SCHEMA if QUESTION_BATCH_SIZE > 1 else response_schema_questions,
+    )
     # # gemini_pro_api = GeminiAPI(model_name="gemini-1.5-pro-latest")
 
-    results = {}
     n_pages = 1
-    claim_queries = {}
-
-    # # Create a CSV file to store the search results
-    results_filename = f"{save_folder}/search_results.json"
-    claim_queries_filename = f"{save_folder}/claim_queries.json"
 
-    existing = {}
-
-    for index, ind_claim in tqdm(enumerate(claims_to_process)):
+    # # Stream results to a JSONL file: one record per query result page plus one
+    # # closing record (with the claim's queries) per claim.
+    results_filename = f"{save_folder}/search_results.jsonl"
+    existing = completed_claims(results_filename)
+    results_writer = SearchResultsWriter(results_filename)
+    print(f"Found {len(existing)} claims with stored results.")
+
+    # # Questions for all pending claims are generated concurrently over every
+    # # key. Batched generation returns once every claim is answered or out of
+    # # retries, and searching starts after it; with single-claim requests,
+    # # searching starts as soon as the next claim's questions arrive.
+    pending_claims = list({
+        ind_claim["claim"]: ind_claim for ind_claim in claims_to_process if ind_claim["claim"] not in existing
+    }.values())
+    if QUESTION_BATCH_SIZE > 1:
+        question_generator = BatchQuestionGenerator(gemini_flash_api, question_prompt_template, batch_size=QUESTION_BATCH_SIZE)
+        try:
+            questions_per_claim = question_generator.generate([ind_claim["claim"] for ind_claim in pending_claims])
+            print(f"Generated questions for {len(pending_claims)} claims with {question_generator.requests} requests.")
+        except QuotaExhaustedError as e:
+            print(f"Stopping early: {e} The remaining claims are picked up by the next run.")
+            questions_per_claim = []
+    else:
+        prompts = [
+            question_prompt_template.replace("[Insert the claim here]", ind_claim["claim"])
+            for ind_claim in pending_claims
+        ]
+        questions_per_claim = stop_on_exhausted_quota(
+            parse_questions(response)
+            # Malformed answers are not cached, so a rerun asks for them again.
+            for response in gemini_flash_api.get_llm_responses(
+                prompts, validate=lambda text: parse_question_text(text) is not None
+            )
+        )
+
+    for index, (ind_claim, llm_questions) in tqdm(enumerate(zip(pending_claims, questions_per_claim)), total=len(pending_claims)):
         claim = ind_claim["claim"]
-        # Generate questions using Gemini API
-        prompt = question_prompt_template.replace("[Insert the claim here]", claim)
-        response = gemini_flash_api.get_llm_response(prompt)
-        llm_questions = json.loads(response.text)
+        if llm_questions is None:
+            # Failed after all retries or answered with malformed JSON; neither is
+            # cached, so the claim is requested again on the next run.
+            print(f"No questions generated for claim: {claim}")
+            continue
         # Extract and format the date``
         sort_date = extract_and_format_date(ind_claim["claim_date"], default_date=min_date)
         search_strings = []
@@ -127,31 +192,27 @@ if __name__ == "__main__":
                 search_strings.append(processed_question)
                 search_types.append("generated_question")
 
-        search_results = []
-        claim_queries[claim] = []
-        
-        store_counter = 0
-        ts = []
+        claim_queries = []
+        claim_results = {}
 
         print("PROCESSING CLAIM: ", claim)
-        results[claim] = {}
 
         for this_search_string, this_search_type in zip(search_strings, search_types):
     #         # Bookkeeping
-            claim_queries[claim].append((
+            claim_queries.append((
                 this_search_string,
                 this_search_type
             ))
 
             sstring_search_results = google_search.fetch_results(this_search_string, sort_date)
-            results[claim][this_search_string] = sstring_search_results
+            claim_results[this_search_string] = sstring_search_results
 
-        # Save updated results and claim_queries after processing each claim
-        with open(results_filename, "w", encoding='utf-8') as fp:
-            json.dump(results, fp, indent=4, ensure_ascii=False)
+        # Append the claim's results; earlier claims are never rewritten
+        results_writer.append_claim(claim, claim_queries, claim_results)
+        existing.add(claim)
 
-        with open(claim_queries_filename, "w", encoding='utf-8') as fp:
-            json.dump(claim_queries, fp, indent=4, ensure_ascii=False)
+    results_writer.close()
+    gemini_flash_api.close()
 
 
 # # TODO: - How do you know that the questions generated are more relevant? (Sir Saqib) 
@@ -1,15 +1,36 @@
 import json
+import logging
 import os
 import sqlite3
 from tqdm import tqdm
 from multiprocessing import Manager, Lock
 import multiprocessing
-from utils.crawler import url2lines
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from utils.crawler import html2json
+from utils.crawl_pipeline import CrawlPipeline
+from utils.response_cache import ResponseCache
+from utils.politeness import PolitenessScheduler
+from utils.document_store import DocumentStore, document_id, encode_document
+from utils.search_results import find_search_results, iter_search_results
+from utils.near_duplicates import NearDuplicateIndex, dedupe_url, simhash
 import gc
+import re
+from collections import Counter
 from urllib.parse import urlparse
 
 
+# In-flight HTTP requests of the fetch stage.
+FETCH_CONCURRENCY = 256
+# Raw HTML of previous runs; reruns only revalidate pages older than the TTL.
+HTTP_CACHE_DIR = "outputs/http_cache"
+# Extracted documents are appended to compressed shards instead of one JSON
+# file per page; index_table rows refer to them by document id (webpage_N).
+DOCUMENT_STORE_DIR = "outputs/document_store"
+# Incremental mode skips links already stored by earlier runs and indexes each
+# page as soon as it is stored, so an interrupted run resumes where it stopped.
+INCREMENTAL = True
+# Recrawl stored pages older than this many days (None keeps them forever).
+RECRAWL_AFTER_DAYS = None
+
 # Blacklists
 BLACKLIST_DOMAINS = {
     "youtube.com", "facebook.com", "researchgate.net"
@@ -45,37 +66,76 @@ def initialize_db(db_path="index.db"):
     conn.commit()
     return conn
 
-def insert_index(conn, key, path, original_url, lock):
+def upsert_index_rows(conn, rows, lock):
+    """
+    Inserts or refreshes (key, path, original_url) rows in a single transaction,
+    stamping them with the current crawl time.
+    """
     try:
         with lock:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO index_table (key, path, original_url) VALUES (?, ?, ?)", 
-                (key, path, original_url)
+            conn.executemany(
+                """
+                INSERT INTO index_table (key, path, original_url) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    path = excluded.path,
+                    original_url = excluded.original_url,
+                    crawl_timestamp = CURRENT_TIMESTAMP
+                """,
+                rows,
             )
             conn.commit()
-    except sqlite3.IntegrityError as e:
-        print(e)
-        print(f"Duplicate entry for key: {key}")
     except Exception as e:
-        print(f"Failed to insert index for {original_url}: {e}")
+        print(f"Failed to insert {len(rows)} index rows: {e}")
+
+def load_stored_links(conn, store, recrawl_after_days=None):
+    """
+    Returns {dedupe_url(original_url): path} for pages stored by earlier runs that are still
+    in the document store and, if recrawl_after_days is set, whose crawl is
+    recent enough.
+    """
+    query = "SELECT original_url, path FROM index_table"
+    params = ()
+    if recrawl_after_days is not None:
+        query += " WHERE crawl_timestamp >= datetime('now', ?)"
+        params = (f"-{recrawl_after_days} days",)
+    stored = {}
+    for url, path in conn.execute(query, params):
+        if url and dedupe_url(url) not in stored and path in store:
+            stored[dedupe_url(url)] = path
+    return stored
+
+def load_indexed_keys(conn):
+    """Returns {key: (path, original_url)} for every indexed key."""
+    return {key: (path, url) for key, path, url in conn.execute("SELECT key, path, original_url FROM index_table")}
 
-def get_scraped_content(link, store_file_path):
+def last_store_counter(conn, store):
+    """Highest webpage_N number used by the index or the document store."""
+    # Rows of runs before migrate_documents.py still hold webpage_N.json paths.
+    pattern = re.compile(r"webpage_(\d+)(?:\.json)?$")
+    paths = [path for path, in conn.execute("SELECT path FROM index_table")]
+    paths += store.ids()
+    numbers = [int(m.group(1)) for m in map(pattern.search, paths) if m]
+    return max(numbers, default=0)
+
+def get_scraped_content(link, doc_id, page):
+    """
+    Extracts a page and encodes it for the document store. Runs in a worker
+    process; the main process is the only writer of the store.
+    """
     try:
-        page_json = url2lines(link)
-        page_json_str = json.dumps(page_json, ensure_ascii=False, indent=4)
-        with open(store_file_path, "w", encoding="utf-8") as out_f:
-            out_f.write(page_json_str)
+        page_json = html2json(page)
+        payload = encode_document(page_json)
+        fingerprint = simhash(page_json.get("text")) if isinstance(page_json, dict) else None
         gc.collect()
         print(f"Successfully processed: {link}")
-        return True, link, store_file_path
+        return True, link, doc_id, payload, fingerprint
     except Exception as e:
         print(f"Error Processing: {e}")
-        return False, link, store_file_path
+        return False, link, doc_id, None, None
 
 def worker_task(args): 
-    link, store_file_path = args
-    return get_scraped_content(link, store_file_path)
+    link, doc_id, page = args
+    return get_scraped_content(link, doc_id, page)
 
 
 def main():
@@ -85,17 +145,33 @@ def main():
     lock = Lock()
     # Initialize variable
     arguments = set()
-    store_counter = 0
     index_entries = [] 
         # Initialize database
     conn = initialize_db("outputs/index.db")
     
-    with open("outputs/search_results.json", "r") as fp:
-        search_results = json.load(fp)
-        document_folder = "outputs/documents"
-        os.makedirs(document_folder, exist_ok=True)
+    # Claims are streamed from the search results file rather than loaded at once.
+    search_results = iter_search_results(find_search_results("outputs"))
+    store = DocumentStore(DOCUMENT_STORE_DIR)
+    near_duplicates = NearDuplicateIndex(os.path.join(DOCUMENT_STORE_DIR, "fingerprints.db"))
+
+    if INCREMENTAL:
+        # Continue numbering after the last stored document instead of overwriting it.
+        store_counter = last_store_counter(conn, store)
+        stored_links = load_stored_links(conn, store, RECRAWL_AFTER_DAYS)
+        indexed_keys = load_indexed_keys(conn)
+        visited.update(stored_links)
+        # Indexed links that are too old to keep are recrawled under their old path.
+        visited_recrawl = {} if RECRAWL_AFTER_DAYS is None else {
+            url: path for url, path in load_stored_links(conn, store).items() if url not in stored_links
+        }
+        print(f"Resuming: {len(stored_links)} links already stored, {len(indexed_keys)} keys indexed.")
+    else:
+        store_counter = 0
+        stored_links = {}
+        indexed_keys = {}
+        visited_recrawl = {}
 
-    for claim_index, (claim, queries) in enumerate(tqdm(search_results.items())):
+    for claim_index, (claim, queries) in enumerate(tqdm(search_results)):
         for query_index, (query, page_results) in enumerate(queries.items()):
             for page_num, results in page_results.items():
                 for webpage_index, result_object in enumerate(results):
@@ -103,38 +179,91 @@ def main():
                     if should_filter_link(link):
                         continue
                     key = f"{claim_index}-{query_index}-{page_num}-{webpage_index}"
+                    # Syndicated, AMP and tracking variants of a link share one download.
+                    canonical_link = dedupe_url(link)
                     
-                    if link in visited:
-                        store_file_path = visited[link]
+                    if canonical_link in visited:
+                        doc_id = visited[canonical_link]
                         
+                    elif canonical_link in visited_recrawl:
+                        # Refresh a stale page under its existing document id.
+                        doc_id = visited_recrawl[canonical_link]
+                        visited[canonical_link] = doc_id
+                        arguments.add((link, doc_id))
+
                     else:
                         store_counter +=1
-                        store_file_path = os.path.join(
-                            document_folder, f"webpage_{store_counter}.json"
-                        )
-                        visited[link] = store_file_path
+                        doc_id = document_id(store_counter)
+                        visited[canonical_link] = doc_id
                         # if (claim_index < 2):
-                        arguments.add((link, store_file_path))
+                        arguments.add((link, doc_id))
                     
-                    index_entries.append((key, store_file_path, link))
+                    index_entries.append((key, doc_id, link))
                         
+    # Keys pointing at pages that are already stored are indexed right away;
+    # the others are indexed as soon as their page is stored.
+    pending_paths = {path for _, path in arguments}
+    path_to_rows = {}
+    ready_rows = []
+    for key, path, url in index_entries:
+        if path in pending_paths:
+            path_to_rows.setdefault(path, []).append((key, path, url))
+        elif indexed_keys.get(key) != (path, url):
+            ready_rows.append((key, path, url))
+    if ready_rows:
+        upsert_index_rows(conn, ready_rows, lock)
+
     print(f"Total unique links to process: {len(arguments)}")
     # Get the number of cpus available - leaving one core free is important to leave
     # for other tasks
-    cpu_count = multiprocessing.cpu_count() - 1
-    print(f"Starting multiprocessing with {cpu_count} processes.")
-    
-    with ProcessPoolExecutor(max_workers=cpu_count) as executor:
-        # Submit all unique futures with the response of the worker task as a key.
-        future_to_args = {executor.submit(worker_task, arg): arg for arg in arguments}
-        
-        for future in tqdm(as_completed(future_to_args), total=len(future_to_args)):
-            success, url, path = future.result()
-            if not success:
-                print(f"Failed to process link: {url}")
+    cpu_count = max(multiprocessing.cpu_count() - 1, 1)
+    print(f"Starting extraction with {cpu_count} processes and {FETCH_CONCURRENCY} concurrent fetches.")
     
-    for key, path, url in tqdm(index_entries, desc="Inserting into Database"):
-        insert_index(conn, key, path, url, lock)
+    duplicate_count = 0
+    failed_count = 0
+
+    def on_result(result):
+        nonlocal duplicate_count, failed_count
+        success, url, path, payload, fingerprint = result
+        if not success:
+            # The keys of a failed page stay pending, so incremental runs retry it.
+            failed_count += 1
+            print(f"Failed to process link: {url}")
+            return
+        rows = path_to_rows.pop(path, [])
+        original = near_duplicates.find(fingerprint)
+        if original is not None and original != path and original in store:
+            # A near-identical copy is already stored: point this page's keys
+            # at it instead of storing and later embedding the text again.
+            duplicate_count += 1
+            rows = [(key, original, link) for key, _, link in rows]
+        else:
+            store.put(path, payload=payload)
+            near_duplicates.add(path, fingerprint)
+        upsert_index_rows(conn, rows, lock)
+
+    # Network fetching runs on one event loop; the process pool only extracts
+    # and stores pages.
+    pipeline = CrawlPipeline(
+        worker_task,
+        fetch_concurrency=FETCH_CONCURRENCY,
+        extract_workers=cpu_count,
+        cache=ResponseCache(HTTP_CACHE_DIR),
+        scheduler=PolitenessScheduler(),
+    )
+    pipeline.run(arguments, on_result=on_result)
+    print(f"Near-duplicate pages stored once and shared: {duplicate_count}")
+    # Pages the pipeline could not download never reach on_result; like failed
+    # extractions, their keys stay unindexed and the next run fetches them again.
+    not_fetched = Counter(pipeline.not_fetched.values())
+    print(
+        f"Pages not stored and left for the next run: {failed_count + sum(not_fetched.values())} "
+        f"({failed_count} failed extraction, {dict(not_fetched)} not fetched)"
+    )
+    near_duplicates.close()
+    store.close()
 
 if __name__ == "__main__":
+    # The fetch and pipeline modules report progress through logging.
+    logging.basicConfig(level=logging.INFO)
     main()
\ No newline at end of file
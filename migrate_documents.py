@@ -0,0 +1,78 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+
+from tqdm import tqdm
+
+from utils.document_store import DocumentStore, legacy_document_id
+
+
+def migrate_ids(db_path, table, column):
+    """Replaces webpage_N.json paths in `table`.`column` with their document ids."""
+    conn = sqlite3.connect(db_path)
+    paths = [path for path, in conn.execute(f"SELECT DISTINCT {column} FROM {table} WHERE {column} LIKE '%.json'")]
+    conn.executemany(
+        f"UPDATE OR IGNORE {table} SET {column} = ? WHERE {column} = ?",
+        [(legacy_document_id(path), path) for path in paths],
+    )
+    conn.commit()
+    conn.close()
+    return len(paths)
+
+
+def migrate(document_folder, store_root, index_db=None, remove=False, batch_size=1000):
+    """
+    Copies every per-page JSON file of `document_folder` into a DocumentStore.
+
+    webpage_N.json is stored under the document id webpage_N. Paths in the
+    index_table of `index_db` and in the store's near-duplicate fingerprints
+    are rewritten to these ids. Files already present in the store are
+    skipped, which makes the migration safe to rerun.
+    """
+    store = DocumentStore(store_root)
+    paths = sorted(glob.glob(os.path.join(document_folder, "*.json")))
+    migrated = skipped = failed = 0
+    for count, path in enumerate(tqdm(paths, desc="Migrating documents"), start=1):
+        if legacy_document_id(path) in store:
+            skipped += 1
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as fp:
+                document = json.load(fp)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Skipping unreadable file {path}: {e}")
+            failed += 1
+            continue
+        store.put(legacy_document_id(path), document, commit=False)
+        migrated += 1
+        if count % batch_size == 0:
+            store.commit()
+    store.close()
+
+    if index_db and os.path.exists(index_db):
+        print(f"Rewrote {migrate_ids(index_db, 'index_table', 'path')} indexed paths to document ids.")
+    fingerprints_db = os.path.join(store_root, "fingerprints.db")
+    if os.path.exists(fingerprints_db):
+        migrate_ids(fingerprints_db, "fingerprints", "doc_id")
+
+    if remove:
+        # Only delete once every document is safely in the store.
+        store = DocumentStore(store_root, readonly=True)
+        for path in paths:
+            if legacy_document_id(path) in store:
+                os.remove(path)
+        store.close()
+
+    print(f"Migrated {migrated} documents, skipped {skipped} already stored, {failed} unreadable.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert per-page JSON documents into a sharded document store.")
+    parser.add_argument("--documents", default="outputs/documents", help="Folder of webpage_N.json files.")
+    parser.add_argument("--store", default="outputs/document_store", help="Document store directory.")
+    parser.add_argument("--index", default="outputs/index.db", help="Index database whose rows are rewritten.")
+    parser.add_argument("--remove", action="store_true", help="Delete the JSON files after migrating them.")
+    args = parser.parse_args()
+    migrate(args.documents, args.store, index_db=args.index, remove=args.remove)
@@ -0,0 +1,13 @@
+# SQLite limits the number of bound parameters per statement.
+SQLITE_BATCH_SIZE = 500
+
+
+def chunked(items, size=SQLITE_BATCH_SIZE):
+    """Yields consecutive slices of at most `size` items of a list."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def placeholders(batch):
+    """Parameter list for an `IN (...)` clause over `batch`."""
+    return ",".join("?" * len(batch))
@@ -0,0 +1,42 @@
+class CacheBudget:
+    def __init__(self, max_size_bytes, measure, low_water=0.9):
+        """
+        Running total of the bytes held by an on-disk cache, with least recently
+        used eviction once it exceeds `max_size_bytes`.
+
+        The total is measured once when the cache is opened and then kept up to
+        date by the cache's own writes, so inserts do not scan the cache. It is
+        measured again before evicting, since other processes may share the cache.
+        Eviction goes down to `low_water` of the limit so that it does not run on
+        every insert.
+
+        Args:
+            max_size_bytes (int): Size limit of the cache.
+            measure (callable): Returns the exact number of bytes currently stored.
+            low_water (float): Fraction of the limit to evict down to.
+        """
+        self.max_size_bytes = max_size_bytes
+        self.target = int(max_size_bytes * low_water)
+        self.measure = measure
+        self.total = measure()
+
+    def add(self, size):
+        self.total += size
+
+    def evict(self, candidates, delete):
+        """
+        Deletes entries until the cache fits again.
+
+        Args:
+            candidates (callable): Returns the entries, least recently used first.
+            delete (callable): Deletes one entry and returns the bytes it freed.
+        """
+        if self.total <= self.max_size_bytes:
+            return
+        self.total = self.measure()
+        if self.total <= self.max_size_bytes:
+            return
+        for entry in candidates():
+            if self.total <= self.target:
+                break
+            self.total -= delete(entry)
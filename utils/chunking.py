@@ -0,0 +1,71 @@
+import re
+from collections import namedtuple
+
+
+# Window and overlap sizes in word tokens; 96 words is roughly the 500
+# characters of the former RecursiveCharacterTextSplitter chunks.
+CHUNK_TOKENS = 96
+OVERLAP_TOKENS = 16
+# A chunk is cut at the last sentence end in its window unless that would
+# leave it shorter than this fraction of the window.
+MIN_SENTENCE_FILL = 0.5
+
+# One scan classifies everything: HTML tags (skipped), words (runs of at most
+# 64 characters, so unbroken junk cannot blow up a chunk) and stray "<".
+TOKEN_PATTERN = re.compile(r"<[^<>]+>|[^\s<]{1,64}|<")
+SENTENCE_END_PATTERN = re.compile(r"[.!?][\"'”’)\]]*$")
+
+Chunk = namedtuple("Chunk", ["text", "start", "end"])
+
+
+def _make_chunk(tokens):
+    return Chunk(" ".join(token[0] for token in tokens), tokens[0][1], tokens[-1][2])
+
+
+def iter_chunks(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS, min_sentence_fill=MIN_SENTENCE_FILL):
+    """
+    Splits a document into overlapping, sentence-aligned chunks in one pass.
+
+    Whitespace is collapsed and HTML tags are dropped while scanning, so there
+    is no separate cleaning copy of the text; only the current window of
+    tokens is held in memory.
+
+    Args:
+        text (str): The raw document text.
+        chunk_tokens (int): Maximum number of word tokens per chunk.
+        overlap_tokens (int): Tokens repeated at the start of the next chunk.
+        min_sentence_fill (float): Minimum window fill for cutting at a sentence end.
+
+    Yields:
+        Chunk: (text, start, end) where text[start:end] of the source is the
+               span the chunk was built from.
+    """
+    window = []
+    emitted_end = -1
+    min_cut = max(int(chunk_tokens * min_sentence_fill), overlap_tokens + 1)
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if len(token) > 1 and token[0] == "<":
+            continue
+        window.append((token, match.start(), match.end(), SENTENCE_END_PATTERN.search(token) is not None))
+        if len(window) < chunk_tokens:
+            continue
+
+        cut = len(window)
+        for i in range(len(window) - 1, min_cut - 2, -1):
+            if window[i][3]:
+                cut = i + 1
+                break
+        yield _make_chunk(window[:cut])
+        emitted_end = window[cut - 1][2]
+
+        # The overlap starts at a sentence start when one falls inside it.
+        keep_from = max(cut - overlap_tokens, 1)
+        for i in range(keep_from, cut):
+            if window[i - 1][3]:
+                keep_from = i
+                break
+        window = window[keep_from:]
+
+    if window and window[-1][2] > emitted_end:
+        yield _make_chunk(window)
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tqdm import tqdm
+
+from utils.crawler import get_browser_pool, selenium_crawler
+from utils.fetcher import AsyncFetcher
+from utils.politeness import interleave_by_host
+
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    def __init__(self, name):
+        """Throughput counters for one pipeline stage."""
+        self.name = name
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.latencies = []
+        self.started_at = time.monotonic()
+
+    def record(self, seconds, success=True):
+        self.busy_seconds += seconds
+        self.latencies.append(seconds)
+        if success:
+            self.completed += 1
+        else:
+            self.failed += 1
+
+    def percentile(self, p):
+        """Latency (seconds) below which p percent of the items completed."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    def summary(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        done = self.completed + self.failed
+        return (
+            f"{self.name}: {self.completed} ok, {self.failed} failed, "
+            f"{done / elapsed:.2f} items/s, "
+            f"{self.busy_seconds / max(done, 1):.3f}s avg per item"
+        )
+
+
+class CrawlPipeline:
+    def __init__(
+        self,
+        extract_fn,
+        fetch_concurrency=256,
+        extract_workers=None,
+        queue_size=None,
+        use_selenium=True,
+        report_every=30,
+        **fetcher_kwargs,
+    ):
+        """
+        Staged crawl: a high-concurrency async fetch stage feeds a bounded queue
+        that a process pool drains with CPU-bound extraction.
+
+        Pages the fetch stage could not download go through a Selenium stage
+        sized to the browser pool before they reach the queue. The bounded queue
+        applies back-pressure, so fetching never runs far ahead of extraction.
+        Links that no stage could download never reach `extract_fn`; they are
+        listed in `not_fetched` with the reason ("throttled", "disallowed" or
+        "failed").
+
+        Args:
+            extract_fn (callable): Picklable function run in the process pool with
+                                   (link, store_file_path, page); its return value
+                                   is passed to `on_result`.
+            fetch_concurrency (int): Maximum number of in-flight HTTP requests.
+            extract_workers (int, optional): Size of the process pool.
+                                             Defaults to cpu_count() - 1.
+            queue_size (int, optional): Fetched pages buffered for extraction.
+                                        Defaults to 4 * extract_workers.
+            use_selenium (bool): Retry failed fetches with a headless browser.
+            report_every (float): Seconds between throughput reports.
+            **fetcher_kwargs: Passed through to AsyncFetcher.
+        """
+        self.extract_fn = extract_fn
+        self.fetch_concurrency = fetch_concurrency
+        self.extract_workers = extract_workers or max(multiprocessing.cpu_count() - 1, 1)
+        self.queue_size = queue_size or 4 * self.extract_workers
+        self.use_selenium = use_selenium
+        self.report_every = report_every
+        self.fetcher_kwargs = fetcher_kwargs
+        self.fetcher_kwargs.setdefault("max_connections", fetch_concurrency)
+        self.stats = {
+            "fetch": StageStats("fetch"),
+            "selenium": StageStats("selenium"),
+            "extract": StageStats("extract"),
+        }
+        self.not_fetched = {}
+
+    def run(self, tasks, on_result=None):
+        """
+        Crawls and extracts all tasks.
+
+        Args:
+            tasks (Iterable[tuple]): (link, store_file_path) pairs.
+            on_result (callable, optional): Called in the main process with the
+                                            return value of `extract_fn` as soon as
+                                            each page is done.
+        """
+        tasks = list(tasks)
+        if self.fetcher_kwargs.get("scheduler"):
+            tasks = interleave_by_host(tasks)
+        with ProcessPoolExecutor(max_workers=self.extract_workers) as process_pool:
+            asyncio.run(self._run(tasks, process_pool, on_result))
+        for stage in self.stats.values():
+            logger.info(stage.summary())
+
+    def _skip(self, link, reason, progress):
+        self.not_fetched[link] = reason
+        progress.update(1)
+
+    async def _run(self, tasks, process_pool, on_result):
+        loop = asyncio.get_running_loop()
+        page_queue = asyncio.Queue(maxsize=self.queue_size)
+        fetch_slots = asyncio.Semaphore(self.fetch_concurrency)
+        browser_pool = get_browser_pool() if self.use_selenium else None
+        selenium_threads = ThreadPoolExecutor(max_workers=browser_pool.max_size) if browser_pool else None
+        progress = tqdm(total=len(tasks), desc="Crawling")
+
+        async def fetch_stage(fetcher, link, path):
+            if fetcher.scheduler:
+                # Wait for the host's politeness budget before taking a fetch
+                # slot, so a slow host never blocks slots other hosts could use.
+                await fetcher.scheduler.wait_ready(link)
+            async with fetch_slots:
+                started = time.monotonic()
+                page = await fetcher.fetch(link)
+                self.stats["fetch"].record(time.monotonic() - started, page is not None)
+                if page is not None:
+                    # Hold the slot until the queue accepts the page, so fetching
+                    # cannot run ahead of extraction.
+                    await page_queue.put((link, path, page))
+                    return
+            if link in fetcher.throttled:
+                # A host that is still throttling us would only get the same
+                # answer for a full browser load.
+                self._skip(link, "throttled", progress)
+                return
+            if link in fetcher.disallowed:
+                self._skip(link, "disallowed", progress)
+                return
+            if browser_pool:
+                if fetcher.scheduler:
+                    await fetcher.scheduler.acquire(link)
+                logger.info(f"Using Selenium for {link}")
+                started = time.monotonic()
+                page = await loop.run_in_executor(
+                    selenium_threads, lambda: selenium_crawler(link, pool=browser_pool)
+                )
+                self.stats["selenium"].record(time.monotonic() - started, page is not None)
+                if page is not None and fetcher.cache:
+                    fetcher.cache.put(link, page)
+            if page is None:
+                self._skip(link, "failed", progress)
+                return
+            await page_queue.put((link, path, page))
+
+        async def extract_stage():
+            while True:
+                item = await page_queue.get()
+                try:
+                    if item is None:
+                        return
+                    started = time.monotonic()
+                    try:
+                        result = await loop.run_in_executor(process_pool, self.extract_fn, item)
+                        success = True
+                    except Exception as e:
+                        logger.error(f"Extraction failed for {item[0]}: {e}")
+                        result, success = None, False
+                    self.stats["extract"].record(time.monotonic() - started, success)
+                    if on_result and result is not None:
+                        on_result(result)
+                    progress.update(1)
+                finally:
+                    page_queue.task_done()
+
+        async def reporter():
+            while True:
+                await asyncio.sleep(self.report_every)
+                for stage in self.stats.values():
+                    logger.info(stage.summary())
+
+        # Two consumers per worker keep the pool busy while results are handled.
+        consumers = [asyncio.create_task(extract_stage()) for _ in range(2 * self.extract_workers)]
+        report_task = asyncio.create_task(reporter())
+        try:
+            async with AsyncFetcher(**self.fetcher_kwargs) as fetcher:
+                await asyncio.gather(*(fetch_stage(fetcher, link, path) for link, path in tasks))
+            for _ in consumers:
+                await page_queue.put(None)
+            await asyncio.gather(*consumers)
+        finally:
+            report_task.cancel()
+            progress.close()
+            if selenium_threads:
+                selenium_threads.shutdown(wait=False)
@@ -3,12 +3,20 @@ from trafilatura.settings import DEFAULT_CONFIG
 import sys
 from time import sleep
 import json
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from utils.fetcher import fetch_all
+
+logger = logging.getLogger(__name__)
 
 
 def initialize_webdriver():
@@ -33,56 +41,158 @@ def initialize_webdriver():
                          'Chrome/85.0.4183.102 Safari/537.36'
         })
     except WebDriverException as e:
-        print(f"Error initializing WebDriver: {e}", file=sys.stderr)
+        logger.error(f"Error initializing WebDriver: {e}")
         driver = None
     return driver
 
 
 
-def selenium_crawler(url, timeout = 10):
-    driver = initialize_webdriver()
+# Headless browser sessions kept warm for the Selenium fallback.
+BROWSER_POOL_SIZE = 2
+PAGES_PER_BROWSER = 50
+COOKIE_BUTTON_TEXTS = ['accept', 'i agree', 'agree', 'consent', 'allow all']
+
+
+class BrowserPool:
+    def __init__(self, max_size=BROWSER_POOL_SIZE, max_pages_per_session=PAGES_PER_BROWSER):
+        """
+        A bounded pool of long-lived headless Chrome sessions.
+
+        Sessions are created lazily, handed out one URL at a time and reused
+        across URLs. A session is quit and replaced after serving
+        `max_pages_per_session` pages or after any error, which keeps memory
+        leaks and broken sessions from piling up.
+
+        Args:
+            max_size (int): Maximum number of browsers alive at the same time.
+            max_pages_per_session (int): Pages served before a browser is recycled.
+        """
+        self.max_size = max_size
+        self.max_pages_per_session = max_pages_per_session
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._page_counts = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def acquire(self):
+        """Blocks until a browser slot is free and returns a warm or fresh driver (None on failure)."""
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        driver = initialize_webdriver()
+        if driver is None:
+            self._slots.release()
+            return None
+        with self._lock:
+            self._page_counts[driver] = 0
+        return driver
+
+    def release(self, driver, recycle=False):
+        """Returns a driver to the pool, quitting it if it is worn out or broken."""
+        with self._lock:
+            self._page_counts[driver] += 1
+            if self._closed or self._page_counts[driver] >= self.max_pages_per_session:
+                recycle = True
+            if recycle:
+                del self._page_counts[driver]
+        if recycle:
+            self._quit(driver)
+        else:
+            try:
+                # Stop any background activity of the previous page.
+                driver.get("about:blank")
+                self._idle.put(driver)
+            except Exception:
+                with self._lock:
+                    self._page_counts.pop(driver, None)
+                self._quit(driver)
+        self._slots.release()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._page_counts.pop(driver, None)
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.warning(f"Error closing WebDriver: {e}")
+
+
+_browser_pool = None
+
+
+def get_browser_pool():
+    """Returns the browser pool of the current process, creating it on first use."""
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool()
+        atexit.register(_browser_pool.close)
+    return _browser_pool
+
+
+def selenium_crawler(url, timeout = 10, pool=None):
+    pool = pool or get_browser_pool()
+    driver = pool.acquire()
     if not driver:
         return None
     
-    driver.implicitly_wait(5)
+    recycle = False
     try:
+        driver.set_page_load_timeout(timeout)
         driver.get(url)
         # Wait for the page to load
         WebDriverWait(driver, timeout).until(
             EC.presence_of_all_elements_located((By.TAG_NAME, "body"))
         )
-        handle_cookie_popup(driver, timeout=5)
-        sleep(1)
+        if handle_cookie_popup(driver, timeout=1):
+            sleep(0.5)
         page_source = driver.page_source
         
     except Exception as e:
-        print(f"Selenium failed for {url}: {e}")
+        logger.warning(f"Selenium failed for {url}: {e}")
         page_source = None
+        recycle = True
         
     finally:
-        driver.quit()
+        pool.release(driver, recycle=recycle)
         
     return page_source
         
 
 
-def handle_cookie_popup(driver, timeout=5):
+def handle_cookie_popup(driver, timeout=1):
     try:
-        # Common button texts; extend this list as needed
-        button_texts = ['Accept', 'I Agree', 'Agree', 'Consent', 'Allow All']
-        for text in button_texts:
-            try:
-                cookie_button = WebDriverWait(driver, timeout).until(
-                    EC.element_to_be_clickable((By.XPATH, f"//button[contains(translate(text(), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz'), '{text.lower()}')]"))
-                )
-                cookie_button.click()
-                print(f"Clicked '{text}' button for cookie consent.", file=sys.stderr)
-                return True
-            except TimeoutException:
-                continue
-        print("No cookie popup detected or unable to handle.", file=sys.stderr)
+        # A single XPath matching every known consent button, so pages without a
+        # popup cost one short wait instead of one wait per button text.
+        lowered = "translate(normalize-space(.), 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+        conditions = " or ".join(f"contains({lowered}, '{text}')" for text in COOKIE_BUTTON_TEXTS)
+        xpath = f"//button[{conditions}]"
+        try:
+            cookie_button = WebDriverWait(driver, timeout, poll_frequency=0.2).until(
+                EC.element_to_be_clickable((By.XPATH, xpath))
+            )
+        except TimeoutException:
+            logger.debug("No cookie popup detected.")
+            return False
+        # Clicking usually removes the consent element, so read its text first.
+        button_text = cookie_button.text
+        cookie_button.click()
+        logger.debug(f"Clicked '{button_text}' button for cookie consent.")
+        return True
     except Exception as e:
-        print(f"Error handling cookie popup: {e}", file=sys.stderr)
+        logger.warning(f"Error handling cookie popup: {e}")
     return False
 
 
@@ -92,16 +202,43 @@ def get_page(url):
         try: 
             page = trafilatura.fetch_url(url, config=DEFAULT_CONFIG)
             assert page is not None
+            break
         except Exception as e: 
-            print(f"Attempt {i+1} with trafilatura failed for {url}: {str(e)}", file=sys.stderr)
+            logger.warning(f"Attempt {i+1} with trafilatura failed for {url}: {str(e)}")
    
     if page is None:
-        print(f"Using Selenium for {url}", file=sys.stderr)
+        logger.info(f"Using Selenium for {url}")
         page = selenium_crawler(url)
    
     return page
 
 
+def get_pages(urls, use_selenium=True, **fetcher_kwargs):
+    """
+    Downloads many URLs concurrently on a pooled async HTTP session and falls
+    back to Selenium for the pages that could not be fetched.
+
+    Args:
+        urls (Iterable[str]): URLs to download.
+        use_selenium (bool): Retry failed fetches with a headless browser.
+        **fetcher_kwargs: Passed through to utils.fetcher.AsyncFetcher.
+
+    Returns:
+        dict: Mapping of url -> html (None if every method failed).
+    """
+    pages = fetch_all(urls, **fetcher_kwargs)
+    failed = [url for url, page in pages.items() if page is None]
+    if use_selenium and failed:
+        pool = get_browser_pool()
+        with ThreadPoolExecutor(max_workers=pool.max_size) as executor:
+            for url, page in zip(failed, executor.map(lambda url: selenium_crawler(url, pool=pool), failed)):
+                logger.info(f"Used Selenium for {url}")
+                pages[url] = page
+                if page is not None and fetcher_kwargs.get("cache"):
+                    fetcher_kwargs["cache"].put(url, page)
+    return pages
+
+
 def html2json(page):
     text = trafilatura.extract(page,favor_recall=True, no_fallback=False, output_format="json", with_metadata=True)
     try:
@@ -111,8 +248,9 @@ def html2json(page):
         return {}
 
 
-def url2lines(url):
-    page = get_page(url)
+def url2lines(url, page=None):
+    if page is None:
+        page = get_page(url)
     if page is None:
         return []
     
@@ -0,0 +1,185 @@
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import zlib
+
+
+def encode_document(document):
+    """Serializes a document to compact, zlib-compressed JSON."""
+    return zlib.compress(json.dumps(document, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_document(payload):
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def document_id(number):
+    return f"webpage_{number}"
+
+
+def legacy_document_id(path):
+    """Document id of a former per-page file, e.g. outputs/documents/webpage_7.json -> webpage_7."""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class DocumentStore:
+    def __init__(self, root="outputs/document_store", shard_size=256 * 1024 ** 2, readonly=False):
+        """
+        Append-only store of extracted documents.
+
+        Documents are kept as compressed JSON records appended to large shard
+        files, with a SQLite index mapping each document id to its shard, offset
+        and length. Reading one document touches only its own bytes through a
+        memory map of the shard, without parsing its neighbours. Writing the same
+        id again appends a new record and repoints the index.
+
+        Document ids are free-form strings; the crawler uses `webpage_N`.
+
+        Args:
+            root (str): Directory holding the shards and the index.
+            shard_size (int): A new shard is started once the current one exceeds this size (bytes).
+            readonly (bool): Open for reading only.
+        """
+        self.root = root
+        self.shard_size = shard_size
+        self.readonly = readonly
+        index_path = os.path.join(root, "index.db")
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(root, exist_ok=True)
+            self.conn = sqlite3.connect(index_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    shard INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                )
+            """)
+            self.conn.commit()
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._writer = None
+        self._writer_shard = None
+
+    def _shard_path(self, shard):
+        return os.path.join(self.root, f"shard_{shard:05d}.bin")
+
+    def _open_writer(self):
+        row = self.conn.execute("SELECT MAX(shard) FROM documents").fetchone()
+        shard = row[0] or 0
+        while os.path.exists(self._shard_path(shard + 1)):
+            shard += 1
+        self._writer_shard = shard
+        self._writer = open(self._shard_path(shard), "ab")
+
+    def put(self, doc_id, document=None, payload=None, commit=True):
+        """
+        Appends a document to the current shard.
+
+        Args:
+            doc_id (str): Identifier of the document.
+            document (dict, optional): The document to store.
+            payload (bytes, optional): A document already encoded with encode_document,
+                                       e.g. by a worker process.
+            commit (bool): Commit the index right away. Pass False when writing many
+                           documents and call commit() afterwards.
+        """
+        if self.readonly:
+            raise IOError("DocumentStore opened read-only")
+        if payload is None:
+            payload = encode_document(document)
+        with self._lock:
+            if self._writer is None:
+                self._open_writer()
+            offset = self._writer.tell()
+            if offset and offset + len(payload) > self.shard_size:
+                self._writer.close()
+                self._writer_shard += 1
+                self._writer = open(self._shard_path(self._writer_shard), "ab")
+                offset = 0
+            self._writer.write(payload)
+            # Data reaches the shard before the index points at it, so a crash
+            # can only leave unreferenced bytes behind, never a dangling entry.
+            self._writer.flush()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, shard, offset, length) VALUES (?, ?, ?, ?)",
+                (doc_id, self._writer_shard, offset, len(payload)),
+            )
+            if commit:
+                self.conn.commit()
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def _locate(self, doc_id):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT shard, offset, length FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+
+    def _read(self, shard, offset, length):
+        mapped = self._maps.get(shard)
+        if mapped is None or offset + length > len(mapped):
+            # The shard grew since it was mapped; map it again.
+            if mapped is not None:
+                mapped.close()
+            with open(self._shard_path(shard), "rb") as fp:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[shard] = mapped
+        return mapped[offset:offset + length]
+
+    def get(self, doc_id):
+        """Returns the stored document, or None if the id is unknown."""
+        location = self._locate(doc_id)
+        if location is None:
+            return None
+        return decode_document(self._read(*location))
+
+    def __contains__(self, doc_id):
+        return self._locate(doc_id) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def ids(self):
+        with self._lock:
+            return [doc_id for doc_id, in self.conn.execute("SELECT doc_id FROM documents")]
+
+    def iter_documents(self):
+        """Yields (doc_id, document) in storage order, reading each shard sequentially."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT doc_id, shard, offset, length FROM documents ORDER BY shard, offset"
+            ).fetchall()
+        for doc_id, shard, offset, length in rows:
+            yield doc_id, decode_document(self._read(shard, offset, length))
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+            self.conn.commit()
+            self.conn.close()
+
+
+def load_document(store, doc_id):
+    """
+    Reads a document from the store, falling back to a legacy per-page JSON file
+    for runs that have not been migrated yet.
+    """
+    document = store.get(doc_id) if store is not None else None
+    if document is None and os.path.exists(doc_id):
+        with open(doc_id, "r", encoding="utf-8") as fp:
+            document = json.load(fp)
+    return document
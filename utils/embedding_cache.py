@@ -0,0 +1,99 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+from utils.batching import chunked, placeholders
+from utils.vector_file import VectorFile
+
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def text_key(text):
+    """Hash of a chunk after whitespace normalization."""
+    normalized = WHITESPACE_PATTERN.sub(" ", text).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, dim, cache_dir="outputs/embedding_cache"):
+        """
+        Persistent cache of chunk embeddings for one model.
+
+        Vectors are appended as float32 rows to a flat file that is read through
+        a numpy memory map; a SQLite index maps the hash of each normalized
+        chunk text to its row. Each model gets its own directory, so the key is
+        effectively (model name, text hash).
+
+        Args:
+            model_name (str): Name of the embedding model.
+            dim (int): Dimensionality of the embeddings.
+            cache_dir (str): Root directory of the cache.
+        """
+        self.model_name = model_name
+        self.dim = dim
+        self.root = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name))
+        os.makedirs(self.root, exist_ok=True)
+        self.vectors = VectorFile(os.path.join(self.root, "vectors.f32"), dim)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(self.root, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, texts):
+        """
+        Looks up embeddings for many texts.
+
+        Returns:
+            list: One vector (list of floats) per text, None for cache misses.
+        """
+        keys = [text_key(text) for text in texts]
+        rows = {}
+        with self._lock:
+            for batch in chunked(list(set(keys))):
+                rows.update(self.conn.execute(
+                    f"SELECT key, row FROM embeddings WHERE key IN ({placeholders(batch)})", batch
+                ).fetchall())
+            vectors = self.vectors.view() if rows else None
+        results = [vectors[rows[key]].tolist() if key in rows else None for key in keys]
+        hits = sum(result is not None for result in results)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts, vectors):
+        """Appends embeddings for texts that are not cached yet."""
+        with self._lock:
+            new_keys, new_vectors = [], []
+            seen = set()
+            for text, vector in zip(texts, vectors):
+                key = text_key(text)
+                if key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(vector)
+            known = set()
+            for batch in chunked(new_keys):
+                known.update(key for key, in self.conn.execute(
+                    f"SELECT key FROM embeddings WHERE key IN ({placeholders(batch)})", batch
+                ))
+            pending = [(key, vector) for key, vector in zip(new_keys, new_vectors) if key not in known]
+            if not pending:
+                return
+            # Vectors reach the file before the index points at them.
+            next_row = self.vectors.append([vector for _, vector in pending])
+            self.conn.executemany(
+                "INSERT INTO embeddings (key, row) VALUES (?, ?)",
+                [(key, next_row + i) for i, (key, _) in enumerate(pending)],
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+        self.vectors.close()
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "outputs/embedding.sock"
+# Frames are a 4-byte big-endian length followed by the body.
+FRAME_HEADER = struct.Struct(">I")
+
+
+def _encode_frame(body):
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def _recv_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Embedding service closed the connection.")
+        data.extend(chunk)
+    return bytes(data)
+
+
+class EmbeddingService:
+    def __init__(self, embeddings, socket_path=DEFAULT_SOCKET_PATH, max_batch_size=256, max_wait_ms=5,
+                 model_name=None, backend=None, dim=None):
+        """
+        Long-lived process holding one embedding model for every script on the node.
+
+        Requests from all connections are queued and merged into micro-batches
+        of up to `max_batch_size` texts, waiting at most `max_wait_ms` for a
+        batch to fill, so many small callers still get large model calls.
+
+        Protocol, over a Unix socket: the request is a JSON frame {"texts": [...]};
+        the reply is a JSON frame {"rows": n, "dim": d} (or {"error": message})
+        followed by a frame of n*d float32 values. A request {"info": true} is
+        answered with {"model", "backend", "dim"} and an empty frame, so clients
+        can check that the service runs the model they expect.
+
+        Args:
+            embeddings (Embeddings): The loaded model.
+            socket_path (str): Path of the Unix socket to listen on.
+            max_batch_size (int): Maximum texts per model call.
+            max_wait_ms (float): Maximum time a request waits for others to join its batch.
+            model_name (str, optional): Name of the served model, reported to clients.
+            backend (str, optional): Backend of the served model, reported to clients.
+            dim (int, optional): Dimensionality of the served vectors, reported to clients.
+        """
+        self.embeddings = embeddings
+        self.info = {"model": model_name, "backend": backend, "dim": dim}
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.batches = 0
+        self.texts = 0
+
+    async def _batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            size = len(pending[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(request)
+                size += len(request[0])
+
+            texts = [text for request_texts, _ in pending for text in request_texts]
+            try:
+                # The model call runs off the event loop so connections keep being served.
+                vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, texts)
+                vectors = np.asarray(vectors, dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Embedding a batch of {len(texts)} texts failed: {e}")
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            offset = 0
+            for request_texts, future in pending:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(request_texts)])
+                offset += len(request_texts)
+
+    async def _handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(FRAME_HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                request = json.loads(await reader.readexactly(FRAME_HEADER.unpack(header)[0]))
+                if request.get("info"):
+                    writer.write(_encode_frame(json.dumps(self.info).encode("utf-8")) + _encode_frame(b""))
+                    await writer.drain()
+                    continue
+                texts = request.get("texts", [])
+                try:
+                    if texts:
+                        future = loop.create_future()
+                        await self.queue.put((texts, future))
+                        vectors = await future
+                    else:
+                        vectors = np.zeros((0, 0), dtype=np.float32)
+                    reply = {"rows": int(vectors.shape[0]), "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0}
+                    body = vectors.tobytes()
+                except Exception as e:
+                    reply, body = {"error": str(e)}, b""
+                writer.write(_encode_frame(json.dumps(reply).encode("utf-8")) + _encode_frame(body))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self.queue = asyncio.Queue()
+        os.makedirs(os.path.dirname(os.path.abspath(self.socket_path)), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        batcher = asyncio.create_task(self._batcher())
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        logger.info(f"Embedding service listening on {self.socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def run(self):
+        asyncio.run(self.serve())
+
+
+class EmbeddingClient(Embeddings):
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=300, request_size=1024):
+        """
+        LangChain embeddings backed by a running EmbeddingService.
+
+        One connection is kept per client and re-opened if it breaks.
+
+        Args:
+            socket_path (str): Unix socket of the service.
+            timeout (float): Seconds to wait for a reply.
+            request_size (int): Maximum texts sent per request.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.request_size = request_size
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _exchange(self, request):
+        body = json.dumps(request).encode("utf-8")
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._sock = self._connect()
+                self._sock.sendall(_encode_frame(body))
+                header = json.loads(_recv_exactly(self._sock, FRAME_HEADER.unpack(_recv_exactly(self._sock, FRAME_HEADER.size))[0]))
+                payload = _recv_exactly(self._sock, FRAME_HEADER.unpack(_recv_exactly(self._sock, FRAME_HEADER.size))[0])
+                break
+            except (ConnectionError, BrokenPipeError, socket.timeout, OSError):
+                self.close()
+                if attempt:
+                    raise
+        return header, payload
+
+    def info(self):
+        """Model name, backend and dimension reported by the service."""
+        with self._lock:
+            header, _ = self._exchange({"info": True})
+        return header
+
+    def _request(self, texts):
+        header, payload = self._exchange({"texts": texts})
+        if "error" in header:
+            raise RuntimeError(f"Embedding service error: {header['error']}")
+        return np.frombuffer(payload, dtype=np.float32).reshape(header["rows"], header["dim"]).tolist()
+
+    def embed_documents(self, texts):
+        vectors = []
+        with self._lock:
+            for start in range(0, len(texts), self.request_size):
+                vectors.extend(self._request(list(texts[start:start + self.request_size])))
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def service_available(socket_path=DEFAULT_SOCKET_PATH):
+    """Whether an embedding service accepts connections on `socket_path`."""
+    if not socket_path or not os.path.exists(socket_path):
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+if __name__ == "__main__":
+    from utils.embeddings import get_embedding_backend
+
+    parser = argparse.ArgumentParser(description="Serve one shared embedding model over a Unix socket.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    parser.add_argument("--backend", default="torch", choices=["torch", "onnx"])
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default="outputs/onnx/all-MiniLM-L6-v2")
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    started = time.monotonic()
+    model = get_embedding_backend(
+        args.backend, args.model, onnx_dir=args.onnx_dir, processes=args.processes, batch_size=args.max_batch_size
+    )
+    # Also warms the model up before the first client arrives.
+    dim = len(model.embed_query("dimension probe"))
+    logger.info(f"Loaded {args.backend} model {args.model} ({dim} dimensions) in {time.monotonic() - started:.1f}s")
+    EmbeddingService(
+        model, args.socket, args.max_batch_size, args.max_wait_ms,
+        model_name=args.model, backend=args.backend, dim=dim,
+    ).run()
@@ -0,0 +1,296 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+logger = logging.getLogger(__name__)
+
+# Sentences used to compare a backend against the reference PyTorch model.
+PARITY_SAMPLE = [
+    "California is 54 billion in debt as of 2020.",
+    "The governor said the state budget deficit was caused by lower tax revenue.",
+    "Joe Biden gave Congress an exemption from the vaccine mandate.",
+    "Officials confirmed that the bridge will reopen to traffic next spring.",
+    "A viral post claims that drinking hot water cures the flu.",
+    "Unemployment fell to 3.5 percent in February, according to the Labor Department.",
+    "The photo shows a protest in Paris, not in London as the caption states.",
+    "Snopes rated the claim false after reviewing the original video footage.",
+]
+# Parity result stored next to an ONNX export, so ingestion does not have to
+# load the reference model to trust the export.
+PARITY_FILE = "parity.json"
+
+
+class OnnxEmbeddings(Embeddings):
+    def __init__(self, model_dir, max_length=256, batch_size=64, intra_op_threads=None):
+        """
+        CPU embeddings from an ONNX export of a sentence-transformers model,
+        using the int8-quantized graph when one is present.
+
+        Produces the same mean-pooled, L2-normalized vectors as the
+        sentence-transformers pipeline of all-MiniLM-L6-v2.
+
+        Args:
+            model_dir (str): Directory written by export_onnx_model.
+            max_length (int): Maximum number of tokens per text.
+            batch_size (int): Texts per inference call.
+            intra_op_threads (int, optional): ONNX Runtime threads per session.
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        quantized = os.path.join(model_dir, "model_quantized.onnx")
+        model_path = quantized if os.path.exists(quantized) else os.path.join(model_dir, "model.onnx")
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([encoding.type_ids for encoding in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(texts[start:start + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+_worker_embeddings = None
+
+
+def _init_worker(factory, factory_kwargs):
+    global _worker_embeddings
+    _worker_embeddings = factory(**factory_kwargs)
+
+
+def _worker_embed(texts):
+    return _worker_embeddings.embed_documents(texts)
+
+
+class MultiProcessEmbeddings(Embeddings):
+    def __init__(self, factory, processes=None, chunk_size=64, **factory_kwargs):
+        """
+        Spreads encoding over a pool of worker processes, each holding its own
+        copy of the model built by `factory(**factory_kwargs)`.
+
+        Args:
+            factory (callable): Picklable callable returning an Embeddings instance.
+            processes (int, optional): Number of workers. Defaults to os.cpu_count().
+            chunk_size (int): Texts sent to a worker per task.
+        """
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.processes,
+            initializer=_init_worker,
+            initargs=(factory, factory_kwargs),
+        )
+
+    def embed_documents(self, texts):
+        chunks = [texts[start:start + self.chunk_size] for start in range(0, len(texts), self.chunk_size)]
+        vectors = []
+        for chunk_vectors in self.pool.map(_worker_embed, chunks):
+            vectors.extend(chunk_vectors)
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def get_embedding_backend(backend="torch", model_name="sentence-transformers/all-MiniLM-L6-v2",
+                          onnx_dir=None, processes=1, batch_size=256):
+    """
+    Builds the embedding model used for ingestion and retrieval.
+
+    Args:
+        backend (str): "torch" for the sentence-transformers reference model, or
+                       "onnx" for an (int8-quantized) ONNX Runtime export.
+        model_name (str): Hugging Face model name.
+        onnx_dir (str, optional): Export directory for the "onnx" backend.
+        processes (int): Worker processes for the "onnx" backend; 1 runs in-process.
+        batch_size (int): Texts per model call.
+
+    Returns:
+        Embeddings: A LangChain-compatible embeddings object.
+    """
+    if backend == "torch":
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"batch_size": batch_size})
+    if backend == "onnx":
+        if not onnx_dir or not os.path.exists(os.path.join(onnx_dir, "tokenizer.json")):
+            raise FileNotFoundError(
+                f"No ONNX export found in {onnx_dir}; run `python -m utils.embeddings export` first."
+            )
+        if processes > 1:
+            # One ONNX Runtime thread per worker; the processes provide the parallelism.
+            return MultiProcessEmbeddings(
+                OnnxEmbeddings, processes=processes, model_dir=onnx_dir, batch_size=batch_size, intra_op_threads=1
+            )
+        return OnnxEmbeddings(onnx_dir, batch_size=batch_size)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def load_embeddings(backend="torch", model_name="sentence-transformers/all-MiniLM-L6-v2", onnx_dir=None,
+                    processes=1, batch_size=256, service_socket=None, dim=None):
+    """
+    Connects to the shared embedding service when one is running on
+    `service_socket`, otherwise loads the model in this process with
+    get_embedding_backend.
+
+    The service is only used if it reports the same model, backend and (when
+    given) dimension; vectors of another model must not reach caches and
+    vector stores keyed for this one.
+    """
+    from utils.embedding_service import EmbeddingClient, service_available
+
+    if service_available(service_socket):
+        client = EmbeddingClient(service_socket)
+        info = client.info()
+        expected = {"model": model_name, "backend": backend, "dim": dim}
+        mismatched = {
+            field: info.get(field) for field, value in expected.items()
+            if value is not None and info.get(field) != value
+        }
+        if not mismatched:
+            logger.info(f"Using embedding service at {service_socket}.")
+            return client
+        client.close()
+        logger.warning(
+            f"Ignoring embedding service at {service_socket}: it serves {mismatched}, "
+            f"expected {expected}. Loading the model in this process."
+        )
+    return get_embedding_backend(backend, model_name, onnx_dir=onnx_dir, processes=processes, batch_size=batch_size)
+
+
+class LazyEmbeddings(Embeddings):
+    def __init__(self, factory, **factory_kwargs):
+        """
+        Defers building the model with `factory(**factory_kwargs)` until the first
+        embed call, so importing a module that defines one costs nothing and runs
+        served entirely from the embedding cache never load the model.
+        """
+        self.factory = factory
+        self.factory_kwargs = factory_kwargs
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.factory(**self.factory_kwargs)
+        return self._model
+
+    def embed_documents(self, texts):
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.model.embed_query(text)
+
+
+def export_onnx_model(model_name, output_dir, quantize=True):
+    """
+    Exports a Hugging Face model to ONNX and, optionally, adds a dynamically
+    int8-quantized copy (model_quantized.onnx) next to it.
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+    model.save_pretrained(output_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+    if quantize:
+        quantizer = ORTQuantizer.from_pretrained(output_dir)
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=output_dir, quantization_config=config)
+    logger.info(f"Exported {model_name} to {output_dir} (quantized={quantize}).")
+
+
+def check_parity(candidate, reference, texts=None, min_cosine=0.98):
+    """
+    Compares a backend with the reference model on the same texts.
+
+    Returns:
+        dict: Minimum and mean cosine similarity between paired embeddings, and
+              whether the minimum reaches `min_cosine`.
+    """
+    texts = texts or PARITY_SAMPLE
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    a /= np.linalg.norm(a, axis=1, keepdims=True)
+    b /= np.linalg.norm(b, axis=1, keepdims=True)
+    cosines = (a * b).sum(axis=1)
+    return {
+        "min_cosine": float(cosines.min()),
+        "mean_cosine": float(cosines.mean()),
+        "passed": bool(cosines.min() >= min_cosine),
+    }
+
+
+def save_parity(onnx_dir, model_name, parity):
+    with open(os.path.join(onnx_dir, PARITY_FILE), "w") as fp:
+        json.dump(dict(parity, model=model_name), fp, indent=4)
+
+
+def load_parity(onnx_dir, model_name):
+    """
+    Parity result stored for the export in `onnx_dir`, or None if the export
+    was never checked against `model_name`.
+    """
+    try:
+        with open(os.path.join(onnx_dir, PARITY_FILE), "r") as fp:
+            parity = json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return parity if parity.get("model") == model_name else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export ONNX embedding models and check them against PyTorch.")
+    parser.add_argument("command", choices=["export", "parity"])
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-dir", default="outputs/onnx/all-MiniLM-L6-v2")
+    parser.add_argument("--no-quantize", action="store_true")
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "export":
+        export_onnx_model(args.model, args.onnx_dir, quantize=not args.no_quantize)
+    candidate = get_embedding_backend("onnx", args.model, onnx_dir=args.onnx_dir, processes=args.processes)
+    reference = get_embedding_backend("torch", args.model)
+    parity = check_parity(candidate, reference)
+    save_parity(args.onnx_dir, args.model, parity)
+    print(json.dumps(parity, indent=4))
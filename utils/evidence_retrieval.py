@@ -0,0 +1,128 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+# Queries embedded per model call and searched per batch request.
+QUERY_BATCH_SIZE = 256
+# Reciprocal rank fusion constant; dampens the weight of the very first ranks.
+RRF_K = 60
+
+
+def embed_queries(embeddings, texts: list, batch_size: int = QUERY_BATCH_SIZE) -> list:
+    """Embeds many query texts with one model call per batch instead of one per query."""
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(embeddings.embed_documents(texts[start:start + batch_size]))
+    return vectors
+
+
+def retrieve_evidence(vectorstore, queries: list, k: int = 10, score_threshold: float = None,
+                      batch_size: int = QUERY_BATCH_SIZE) -> list:
+    """
+    Runs many claim-filtered top-k searches at once.
+
+    Args:
+        vectorstore (VectorStore): Store holding the claim chunks.
+        queries (list): (claim_id, text) pairs; a claim_id of None searches all claims.
+        k (int): Results per query.
+        score_threshold (float, optional): Minimum similarity of a result.
+        batch_size (int): Queries per embedding call and per search request.
+
+    Returns:
+        list: One [(Document, score)] list per query, best first.
+    """
+    if not queries:
+        return []
+    claim_ids = [claim_id for claim_id, _ in queries]
+    vectors = embed_queries(vectorstore.embeddings, [text for _, text in queries], batch_size)
+    results = []
+    for start in range(0, len(vectors), batch_size):
+        results.extend(vectorstore.search_by_vectors(
+            vectors[start:start + batch_size], k, claim_ids[start:start + batch_size], score_threshold
+        ))
+    return results
+
+
+def chunk_key(document):
+    """Identity of a chunk across the dense and sparse result lists."""
+    metadata = document.metadata
+    return metadata.get("claim_id"), metadata.get("document_id"), metadata.get("chunk_number")
+
+
+def reciprocal_rank_fusion(result_lists: list, k: int = 10, rrf_k: int = RRF_K) -> list:
+    """
+    Merges ranked [(Document, score)] lists by summing 1 / (rrf_k + rank) per chunk.
+
+    Returns:
+        list: [(Document, fused score)] of the k best chunks, best first.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, (document, _) in enumerate(results, start=1):
+            key = chunk_key(document)
+            previous = fused.get(key)
+            fused[key] = (document, (previous[1] if previous else 0.0) + 1.0 / (rrf_k + rank))
+    return sorted(fused.values(), key=lambda result: result[1], reverse=True)[:k]
+
+
+def retrieve_hybrid(vectorstore, sparse_index, queries: list, k: int = 10, dense_k: int = None,
+                    sparse_k: int = None, rrf_k: int = RRF_K, batch_size: int = QUERY_BATCH_SIZE) -> list:
+    """
+    Claim-filtered dense and BM25 searches for many queries, merged per query
+    with reciprocal rank fusion.
+
+    Exact numbers and names that the dense model blurs are recovered by the
+    sparse side, so dense_k can stay small.
+
+    Args:
+        vectorstore (VectorStore): Store holding the claim chunks.
+        sparse_index (BM25Index): BM25 index built next to the vector store at ingestion.
+        queries (list): (claim_id, text) pairs.
+        k (int): Fused results per query.
+        dense_k (int, optional): Dense candidates per query. Defaults to k.
+        sparse_k (int, optional): BM25 candidates per query. Defaults to k.
+
+    Returns:
+        list: One [(Document, fused score)] list per query, best first.
+    """
+    dense_results = retrieve_evidence(vectorstore, queries, dense_k or k, batch_size=batch_size)
+    sparse_hits = sparse_index.search_many(queries, sparse_k or k)
+    # Chunk texts live only in the vector store; BM25 hits are resolved there in one lookup.
+    documents = vectorstore.get_by_ids(list({point_id for hits in sparse_hits for point_id, _ in hits}))
+    results = []
+    for dense, hits in zip(dense_results, sparse_hits):
+        sparse = [(documents[point_id], score) for point_id, score in hits if point_id in documents]
+        results.append(reciprocal_rank_fusion([dense, sparse], k, rrf_k))
+    return results
+
+
+def retrieve_claim_evidence(vectorstore, claim_queries: dict, k: int = 10, score_threshold: float = None,
+                            batch_size: int = QUERY_BATCH_SIZE) -> dict:
+    """
+    Retrieves evidence for many claims, each searched with one or more queries
+    (the claim itself, generated questions, ...).
+
+    Chunks found by several queries of a claim are kept once with their best score.
+
+    Args:
+        vectorstore (VectorStore): Store holding the claim chunks.
+        claim_queries (dict): {claim_id: [query text, ...]}.
+        k (int): Results per query and per claim.
+
+    Returns:
+        dict: {claim_id: [(Document, score), ...]} with at most k chunks per claim, best first.
+    """
+    queries = [(claim_id, text) for claim_id, texts in claim_queries.items() for text in texts]
+    results = retrieve_evidence(vectorstore, queries, k, score_threshold, batch_size)
+    merged = {claim_id: {} for claim_id in claim_queries}
+    for (claim_id, _), query_results in zip(queries, results):
+        best = merged[claim_id]
+        for document, score in query_results:
+            key = (document.metadata.get("document_id"), document.metadata.get("chunk_number"), document.page_content)
+            if key not in best or score > best[key][1]:
+                best[key] = (document, score)
+    return {
+        claim_id: sorted(best.values(), key=lambda result: result[1], reverse=True)[:k]
+        for claim_id, best in merged.items()
+    }
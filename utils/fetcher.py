@@ -0,0 +1,218 @@
+import asyncio
+import logging
+
+import aiohttp
+
+from utils.politeness import THROTTLE_STATUSES
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_HEADERS = {
+    "User-Agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) '
+                  'AppleWebKit/537.36 (KHTML, like Gecko) '
+                  'Chrome/85.0.4183.102 Safari/537.36',
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+
+class AsyncFetcher:
+    def __init__(
+        self,
+        max_connections=200,
+        max_per_host=4,
+        connect_timeout=10,
+        read_timeout=20,
+        total_timeout=30,
+        keepalive_timeout=30,
+        retries=2,
+        max_page_size=10 * 1024 * 1024,
+        headers=None,
+        cache=None,
+        scheduler=None,
+    ):
+        """
+        Asynchronous HTTP fetcher backed by a single pooled aiohttp session.
+
+        Connections are kept alive and reused across requests, so pages on the
+        same host only pay the TCP/TLS handshake once per pooled connection.
+
+        Args:
+            max_connections (int): Total number of simultaneous connections.
+            max_per_host (int): Simultaneous connections allowed per host.
+            connect_timeout (float): Seconds allowed to establish a connection.
+            read_timeout (float): Seconds allowed between two reads of the body.
+            total_timeout (float): Upper bound in seconds for a whole request.
+            keepalive_timeout (float): Seconds an idle pooled connection is kept open.
+            retries (int): Number of attempts per URL before giving up.
+            max_page_size (int): Responses larger than this (bytes) are discarded.
+            headers (dict, optional): Request headers. Defaults to DEFAULT_HEADERS.
+            cache (ResponseCache, optional): On-disk response cache. Fresh entries are
+                                             served without a request, stale ones are
+                                             revalidated with ETag/Last-Modified.
+            scheduler (PolitenessScheduler, optional): Per-host rate limiting, adaptive
+                                                       backoff and robots.txt checks.
+        """
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(
+            total=total_timeout,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout,
+        )
+        self.retries = retries
+        self.max_page_size = max_page_size
+        self.headers = headers or DEFAULT_HEADERS
+        self.cache = cache
+        self.scheduler = scheduler
+        # URLs skipped because robots.txt disallows them.
+        self.disallowed = set()
+        # URLs whose host was still throttling (429/503) after the last attempt.
+        self.throttled = set()
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers=self.headers,
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    async def _request(self, url, headers=None):
+        async with self.session.get(url, allow_redirects=True, headers=headers) as response:
+            if response.status == 304:
+                return None, response.headers
+            if response.status != 200:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history,
+                    status=response.status, message=response.reason,
+                    headers=response.headers,
+                )
+            content_type = response.headers.get("Content-Type", "")
+            if content_type and "html" not in content_type and "xml" not in content_type:
+                raise ValueError(f"Unsupported content type: {content_type}")
+            if (response.content_length or 0) > self.max_page_size:
+                raise ValueError(f"Page too large: {response.content_length} bytes")
+            body = await response.read()
+            if len(body) > self.max_page_size:
+                raise ValueError(f"Page too large: {len(body)} bytes")
+            return body.decode(response.get_encoding() or "utf-8", errors="replace"), response.headers
+
+    async def fetch(self, url):
+        """
+        Fetches a single URL.
+
+        Args:
+            url (str): The URL to download.
+
+        Returns:
+            str or None: The decoded HTML if successful, else None.
+        """
+        cached = self.cache.get(url) if self.cache else None
+        if cached and cached["fresh"]:
+            return cached["html"]
+
+        conditional_headers = {}
+        if cached:
+            if cached["etag"]:
+                conditional_headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                conditional_headers["If-Modified-Since"] = cached["last_modified"]
+
+        if self.scheduler and not await self.scheduler.allowed(url, self.session):
+            logger.info(f"Disallowed by robots.txt: {url}")
+            self.disallowed.add(url)
+            return cached["html"] if cached else None
+
+        throttled = False
+        for attempt in range(self.retries):
+            throttled = False
+            try:
+                if self.scheduler:
+                    await self.scheduler.acquire(url)
+                html, headers = await self._request(url, conditional_headers or None)
+                if self.scheduler:
+                    self.scheduler.record(url, 200)
+                if html is None:
+                    # 304 Not Modified: the cached copy is still valid.
+                    self.cache.refresh(url, headers.get("ETag"), headers.get("Last-Modified"))
+                    return cached["html"]
+                if self.cache:
+                    self.cache.put(url, html, headers.get("ETag"), headers.get("Last-Modified"))
+                return html
+            except aiohttp.ClientResponseError as e:
+                throttled = e.status in THROTTLE_STATUSES
+                if self.scheduler:
+                    self.scheduler.record(url, e.status, e.headers.get("Retry-After") if e.headers else None)
+                    if throttled:
+                        # The scheduler delays the next attempt for this host.
+                        logger.warning(f"Attempt {attempt + 1} throttled for {url}: {e.status}")
+                        continue
+                logger.warning(f"Async fetch failed for {url}: {e}")
+                break
+            except ValueError as e:
+                # The server answered; retrying will not change the answer.
+                logger.warning(f"Async fetch failed for {url}: {e}")
+                break
+            except Exception as e:
+                logger.warning(f"Attempt {attempt + 1} with async fetch failed for {url}: {e!r}")
+        if throttled:
+            self.throttled.add(url)
+        # Serve a stale copy rather than nothing when revalidation fails.
+        return cached["html"] if cached else None
+
+    async def fetch_many(self, urls):
+        """
+        Fetches many URLs concurrently, yielding results as they complete.
+
+        Args:
+            urls (Iterable[str]): URLs to download.
+
+        Yields:
+            tuple: (url, html) where html is None if the fetch failed.
+        """
+        async def fetch_one(url):
+            return url, await self.fetch(url)
+
+        tasks = [asyncio.ensure_future(fetch_one(url)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def fetch_all(urls, **fetcher_kwargs):
+    """
+    Blocking helper that downloads all URLs on one event loop.
+
+    Args:
+        urls (Iterable[str]): URLs to download.
+        **fetcher_kwargs: Passed through to AsyncFetcher.
+
+    Returns:
+        dict: Mapping of url -> html (None for failed fetches).
+    """
+    async def run():
+        pages = {}
+        async with AsyncFetcher(**fetcher_kwargs) as fetcher:
+            async for url, html in fetcher.fetch_many(urls):
+                pages[url] = html
+        return pages
+
+    return asyncio.run(run())
@@ -1,11 +1,53 @@
 import google.generativeai as genai
+from google.auth.credentials import AnonymousCredentials
 from google.generativeai import GenerationConfig
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
-from itertools import cycle
+from concurrent.futures import ThreadPoolExecutor
 import json
-import time
+import threading
 from typing import List
 
+from utils.llm_cache import CachedResponse, LLMResponseCache, request_key
+from utils.quota_ledger import QuotaLedger
+from utils.rate_limiter import KeyRateLimiter
+
+# Error classes of the retry policy.
+QUOTA_ERROR = "quota"          # 429: move to another key, cool this one down
+TRANSIENT_ERROR = "transient"  # 5xx, timeouts, connection resets: back off and retry
+KEY_ERROR = "key"              # invalid or revoked key: take it out of rotation
+PERMANENT_ERROR = "permanent"  # invalid request or blocked prompt: do not retry
+# How long a rejected key stays out of rotation.
+KEY_DISABLE_SECONDS = 3600
+# Request header carrying the API key.
+API_KEY_HEADER = "x-goog-api-key"
+
+
+def classify_error(error):
+    """Maps an exception raised by a Gemini call to one of the retry policy's error classes."""
+    from google.api_core import exceptions as api_exceptions
+
+    message = str(error)
+    if isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+        return QUOTA_ERROR
+    if isinstance(error, (api_exceptions.PermissionDenied, api_exceptions.Unauthenticated)):
+        return KEY_ERROR
+    if isinstance(error, api_exceptions.InvalidArgument) and "API key" in message:
+        return KEY_ERROR
+    if isinstance(error, (api_exceptions.ServerError, api_exceptions.DeadlineExceeded, api_exceptions.Aborted)):
+        return TRANSIENT_ERROR
+    if isinstance(error, api_exceptions.ClientError):
+        return PERMANENT_ERROR
+    if isinstance(error, (genai.types.BlockedPromptException, genai.types.StopCandidateException)):
+        return PERMANENT_ERROR
+    # Network errors from the transport and anything unknown are retried.
+    return TRANSIENT_ERROR
+
+
+def is_daily_quota_error(error):
+    message = str(error).lower()
+    return "perday" in message.replace(" ", "").replace("_", "") or "per day" in message
+
+
 class GeminiAPI:
     def __init__(
         self,
@@ -17,6 +59,17 @@ class GeminiAPI:
         top_k=40,
         response_mime_type="text/plain",
         safety_settings=None,
+        requests_per_minute=None,
+        requests_per_day=None,
+        max_workers=None,
+        cache_dir="outputs/llm_cache",
+        cache_mode="use",
+        cache_max_bytes=512 * 1024 ** 2,
+        max_retries=5,
+        backoff_base=2.0,
+        backoff_max=300.0,
+        tokens_per_minute=None,
+        quota_ledger="outputs/quota_ledger.db",
     ):
         """
         Initializes the GeminiAPI with the specified configurations.
@@ -32,6 +85,25 @@ class GeminiAPI:
             response_mime_type (str, optional): MIME type of the response. Defaults to "text/plain".
             safety_settings (dict, optional): Safety settings for content generation.
                                               If None, default settings are applied.
+            requests_per_minute (float, optional): Per-key rate limit. Defaults to the free tier
+                                                   of the model (15 for flash, 2 otherwise).
+            requests_per_day (int, optional): Per-key daily quota. Defaults to the free tier
+                                              of the model (1500 for flash, 50 otherwise).
+            max_workers (int, optional): Concurrent requests of get_llm_responses.
+                                         Defaults to one per key.
+            cache_dir (str, optional): Directory of the persistent response cache.
+            cache_mode (str, optional): "use" (default) answers repeated prompts from the
+                                        cache, "refresh" re-queries but updates the cache,
+                                        "bypass" disables it.
+            cache_max_bytes (int, optional): Size limit of the cache; least recently
+                                             used responses are evicted beyond it.
+            max_retries (int, optional): Retries of a request after quota or transient errors.
+            backoff_base (float, optional): First cooldown of a failing key, in seconds.
+            backoff_max (float, optional): Longest cooldown of a failing key, in seconds.
+            tokens_per_minute (int, optional): Per-key token limit. Defaults to the free tier
+                                               of the model (1M for flash, 32k otherwise).
+            quota_ledger (str, optional): Path of the usage ledger shared with other
+                                          processes and runs; None keeps usage in memory only.
         """
         self.model_name = model_name
         self.generation_config = GenerationConfig(
@@ -41,7 +113,6 @@ class GeminiAPI:
             response_mime_type=response_mime_type,
             response_schema=response_schema,
         )
-        
         # Default safety settings
         if safety_settings is None:
             self.safety_settings = {
@@ -53,92 +124,222 @@ class GeminiAPI:
         else:
             self.safety_settings = safety_settings
 
-        # Configure API keys and rate limiting (Free version)
+        # Everything besides the prompt that changes the response.
+        self.cache_config = {
+            "temperature": temperature,
+            "top_p": top_p,
+            "top_k": top_k,
+            "response_mime_type": response_mime_type,
+            "response_schema": response_schema,
+            "safety_settings": (
+                {str(category): str(threshold) for category, threshold in self.safety_settings.items()}
+                if isinstance(self.safety_settings, dict) else self.safety_settings
+            ),
+        }
+        self.cache = LLMResponseCache(cache_dir, mode=cache_mode, max_size_bytes=cache_max_bytes)
+
+        # Rate limits per key (Free version); every key is used concurrently.
         if "flash" in model_name:
-            self.max_requests_per_key = 1500
-            self.sleep_time = 3.5
+            self.requests_per_minute = requests_per_minute or 15
+            self.requests_per_day = requests_per_day or 1500
+            self.tokens_per_minute = tokens_per_minute or 1_000_000
         else:
-            self.max_requests_per_key = 50
-            self.sleep_time = 15
-
-        self.request_count = 0
+            self.requests_per_minute = requests_per_minute or 2
+            self.requests_per_day = requests_per_day or 50
+            self.tokens_per_minute = tokens_per_minute or 32_000
 
         with open(secrets_file, "r") as f:
-            self.api_keys = cycle(json.load(f)["keys"])
+            self.api_keys = json.load(f)["keys"]
 
-        self.get_model = self.get_gemini_model()
-        self.model = self.get_model()
+        # Limits are checked against the usage of every process on the node.
+        self.ledger = QuotaLedger(quota_ledger) if quota_ledger else None
+        self.limiter = KeyRateLimiter(
+            self.api_keys,
+            self.requests_per_minute,
+            self.requests_per_day,
+            ledger=self.ledger,
+            tokens_per_minute=self.tokens_per_minute,
+        )
+        self.model = self.get_gemini_model()
+        self.max_workers = max_workers or len(self.api_keys)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Key of the previous request, per calling thread.
+        self._local = threading.local()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
 
     def get_gemini_model(self):
         """
-        Initializes and returns a function to get the current Gemini model using the next API key.
+        Returns the Gemini model shared by all keys.
+
+        genai.configure sets one process-wide key, so the client is configured
+        without one and every request carries its key in its own metadata (see
+        request_options); requests on different keys can then run from several
+        threads at once.
         """
-        def initialize_model():
-            current_key = next(self.api_keys)
-            print("Using key: ****" + current_key[-5:])
-            genai.configure(api_key=current_key)
-            return genai.GenerativeModel(
-                self.model_name,
-                safety_settings=self.safety_settings
-            )
-        return initialize_model
+        genai.configure(credentials=AnonymousCredentials())
+        return genai.GenerativeModel(
+            self.model_name,
+            safety_settings=self.safety_settings
+        )
+
+    @staticmethod
+    def request_options(api_key):
+        """Per-request options that send the request with `api_key`."""
+        return {"metadata": [(API_KEY_HEADER, api_key)]}
 
-    def get_llm_response(self, input_text):
+    def get_llm_response(self, input_text, force_rotate=False, validate=None, refresh=False):
         """
         Generates a response from the Gemini model based on the input_text using generate_content.
+
+        Blocks until one of the keys is within its rate limit. Safe to call
+        from several threads. Prompts answered before with the same model and
+        generation config are served from the response cache without a request.
+
         Args:
             input_text (str): The prompt to send to the model.
+            force_rotate (bool, optional): Avoid the key used by this thread's previous request.
+            validate (callable, optional): Called with the response text; only texts it
+                                           accepts are cached, and cached texts it rejects
+                                           are dropped and requested again.
+            refresh (bool, optional): Ignore a cached response and request a new one.
         Returns:
             str or None: The model's response in the specified MIME type if successful, else None.
         """
-        if self.request_count >= self.max_requests_per_key:
-            self.model = self.get_model()
-            self.request_count = 0
+        cache_key = request_key(self.model_name, self.cache_config, input_text)
+        cached = None if refresh else self.cache.get(cache_key)
+        if cached is not None:
+            if validate is None or validate(cached):
+                return CachedResponse(cached)
+            self.cache.invalidate(cache_key)
 
+        last_key = getattr(self._local, "last_key", None)
+        response = self.send_with_retries(
+            lambda key: self.model.generate_content(
+                input_text, generation_config=self.generation_config, request_options=self.request_options(key)
+            ),
+            exclude={last_key} if force_rotate and last_key else None,
+        )
+        if response is None:
+            return None
         try:
-            response = self.model.generate_content(
-                input_text,
-                generation_config=self.generation_config
-            )
-            time.sleep(self.sleep_time)
-            self.request_count += 1
+            text = response.text
+        except ValueError:
+            # Blocked or empty candidates have no text and are not cached.
             return response
-        except Exception as e:
-            print(f"Error: {e}")
-            time.sleep(self.sleep_time)
-            return None
-        
-    def get_chat_response(self, input_text, chat=None, reset=True):
-        if self.request_count >= self.max_requests_per_key:
-            self.model = self.get_model()
-            self.request_count = 0
+        if validate is None or validate(text):
+            self.cache.put(cache_key, self.model_name, text)
+        return response
+
+    def send_with_retries(self, send, key=None, exclude=None):
+        """
+        Runs `send(api_key)` under the retry policy.
+
+        Quota errors cool the key down and move the request to another key at
+        once; transient errors do the same with a jittered exponential cooldown
+        that grows with the key's consecutive failures; rejected keys leave the
+        rotation for KEY_DISABLE_SECONDS. Permanent errors are not retried.
+
+        Args:
+            send (callable): Sends the request with the given API key.
+            key (str, optional): Pin the request to one key, e.g. for a chat with history.
+            exclude (set, optional): Keys to avoid for the first attempt.
 
+        Returns:
+            The response, or None if the request failed permanently or ran out of retries.
+        """
+        for attempt in range(self.max_retries + 1):
+            current = self.limiter.acquire(key=key, exclude=exclude if attempt == 0 else None)
+            self._local.last_key = current
+            try:
+                response = send(current)
+            except Exception as e:
+                kind = classify_error(e)
+                print(f"Error ({kind}, key ****{current[-5:]}, attempt {attempt + 1}): {e}")
+                if kind == PERMANENT_ERROR:
+                    return None
+                if kind == KEY_ERROR:
+                    self.limiter.disable(current, KEY_DISABLE_SECONDS)
+                elif kind == QUOTA_ERROR and is_daily_quota_error(e):
+                    self.limiter.exhaust(current)
+                else:
+                    # The limiter keeps the key out of rotation for the
+                    # cooldown, so the next acquire picks a healthy key or,
+                    # with a single key, waits out the backoff.
+                    self.limiter.report_failure(current, self.backoff_base, self.backoff_max)
+                continue
+            self.limiter.report_success(current)
+            usage = getattr(response, "usage_metadata", None)
+            self.limiter.record_tokens(current, getattr(usage, "total_token_count", 0) if usage else 0)
+            return response
+        print(f"Giving up after {self.max_retries + 1} attempts.")
+        return None
+
+    def get_llm_responses(self, input_texts, validate=None, refresh=False):
+        """
+        Sends many prompts concurrently over all keys.
+
+        Args:
+            input_texts (list): The prompts.
+            validate (callable or list, optional): Passed on to get_llm_response;
+                                                   a list holds one validator per prompt.
+            refresh (bool, optional): Passed on to get_llm_response.
+
+        Returns:
+            Iterator: Responses (or None) in the order of `input_texts`, each
+                      yielded as soon as it and all earlier ones are done.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        validators = validate if isinstance(validate, (list, tuple)) else [validate] * len(input_texts)
+        return self._executor.map(
+            lambda text, check: self.get_llm_response(text, validate=check, refresh=refresh),
+            input_texts, validators,
+        )
+
+    def get_chat_response(self, input_text, chat=None, reset=True):
         if reset:
-            chat = self.model.start_chat(history=[])
-        try:
-            resp = chat.send_message(content=input_text, 
-                                     generation_config=self.generation_config)
-            time.sleep(self.sleep_time)
-            self.request_count += 1
-            return resp
-        except Exception as e:
-            print(f"Error: {e}")
-            time.sleep(self.sleep_time)
-            return None
+            # A new chat has no history yet, so each attempt may start it on
+            # whichever key is healthy.
+            def send(key):
+                new_chat = self.model.start_chat(history=[])
+                new_chat.api_key = key
+                return new_chat.send_message(
+                    content=input_text, generation_config=self.generation_config, request_options=self.request_options(key)
+                )
+
+            return self.send_with_retries(send)
+        # A chat stays on the key it was started with.
+        return self.send_with_retries(
+            lambda key: chat.send_message(
+                content=input_text, generation_config=self.generation_config, request_options=self.request_options(key)
+            ),
+            key=getattr(chat, "api_key", None),
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.cache.close()
+        if self.ledger is not None:
+            self.ledger.close()
         
     def get_text_embeddings(self, batched_text: List[str], out_dim=None, task="semantic_similarity"):
-        if out_dim:
-            result = genai.embed_content(model="models/text-embedding-004", 
-                                content=batched_text,
-                                output_dimensionality=out_dim,
-                                task_type=task
-                                )
-        else:
-            result = genai.embed_content(model="models/text-embedding-004", 
-                                content=batched_text,
-                                task_type=task
-                                )
-        return result['embedding']
+        options = {"output_dimensionality": out_dim} if out_dim else {}
+        result = self.send_with_retries(
+            lambda key: genai.embed_content(
+                model="models/text-embedding-004",
+                content=batched_text,
+                task_type=task,
+                request_options=self.request_options(key),
+                **options,
+            )
+        )
+        return result['embedding'] if result is not None else None
 
 # Usage Example:
 
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from utils.cache_budget import CacheBudget
+
+
+CACHE_MODES = ("use", "refresh", "bypass")
+
+
+class CachedResponse:
+    """Stands in for a Gemini response served from the cache; callers only read `.text`."""
+
+    cached = True
+
+    def __init__(self, text):
+        self.text = text
+
+    def __repr__(self):
+        return f"CachedResponse(text={self.text[:60]!r})"
+
+
+def request_key(model_name, generation_config, prompt):
+    """
+    Cache key of a request: model name, generation config (including the
+    response schema) and a hash of the prompt text.
+    """
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "generation_config": generation_config,
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self, cache_dir="outputs/llm_cache", mode="use", max_size_bytes=512 * 1024 ** 2):
+        """
+        Persistent cache of LLM responses in a single SQLite file.
+
+        Response texts are stored zlib-compressed; once they exceed
+        `max_size_bytes`, the least recently used entries are evicted.
+
+        Args:
+            cache_dir (str): Directory holding the cache database.
+            mode (str): "use" serves stored responses and stores new ones, so a rerun
+                        warm-starts from earlier runs; "refresh" ignores stored
+                        responses but stores new ones; "bypass" disables the cache.
+            max_size_bytes (int): Upper bound for the compressed responses.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if mode == "bypass":
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "responses.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+        self.budget = CacheBudget(max_size_bytes, self._measure)
+
+    def get(self, key):
+        """Returns the cached response text for `key`, or None."""
+        if self.mode != "use":
+            return None
+        with self._lock:
+            row = self.conn.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key, model_name, text):
+        if self.mode == "bypass":
+            return
+        body = zlib.compress(text.encode("utf-8"), 6)
+        now = time.time()
+        with self._lock:
+            replaced = self._delete(key)
+            self.conn.execute(
+                "INSERT INTO responses (key, model, body, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, body, len(body), now, now),
+            )
+            self.budget.add(len(body) - replaced)
+            self.budget.evict(
+                lambda: self.conn.execute("SELECT key FROM responses ORDER BY accessed_at").fetchall(),
+                lambda row: self._delete(row[0]),
+            )
+            self.conn.commit()
+
+    def invalidate(self, key):
+        """Drops the response stored for `key`, e.g. after it failed to parse."""
+        if self.conn is None:
+            return
+        with self._lock:
+            self.budget.add(-self._delete(key))
+            self.conn.commit()
+
+    def _delete(self, key):
+        row = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return 0
+        self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        return row[0]
+
+    def _measure(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def size(self):
+        if self.conn is None:
+            return 0
+        with self._lock:
+            return self._measure()
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,127 @@
+import hashlib
+import re
+import sqlite3
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from utils.response_cache import canonicalize_url
+
+
+SIMHASH_BITS = 64
+# Fingerprints within this Hamming distance are treated as the same document.
+MAX_HAMMING_DISTANCE = 3
+# With 4 bands of 16 bits, two fingerprints differing in at most 3 bits always
+# share one band exactly, so candidates can be found with plain index lookups.
+SIMHASH_BANDS = 4
+# Texts shorter than this are too generic (error pages, stubs) to deduplicate.
+MIN_WORDS = 50
+SHINGLE_SIZE = 3
+
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+AMP_PATH_PATTERN = re.compile(r"/amp/?$|\.amp(?=\.html?$)|/amp(?=/)", re.IGNORECASE)
+AMP_QUERY_PARAMS = {"amp", "outputtype", "amp_js_v"}
+
+
+def dedupe_url(url):
+    """
+    Canonical form used to recognize the same page behind different links:
+    canonicalize_url, plus one scheme for http/https, no `www.` or `amp.`/`m.`
+    host prefix, and AMP path/query variants folded into the regular page.
+    """
+    parts = urlsplit(canonicalize_url(url))
+    host = parts.netloc
+    for prefix in ("www.", "amp.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    path = AMP_PATH_PATTERN.sub("", parts.path) or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k.lower() not in AMP_QUERY_PARAMS]
+    return urlunsplit(("http", host, path, urlencode(query), ""))
+
+
+def simhash(text):
+    """
+    64-bit SimHash of the word shingles of a text.
+
+    Returns:
+        int or None: The fingerprint, or None if the text is too short to compare.
+    """
+    if not text:
+        return None
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    weights = [0] * SIMHASH_BITS
+    for i in range(len(words) - SHINGLE_SIZE + 1):
+        shingle = " ".join(words[i:i + SHINGLE_SIZE])
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def _bands(fingerprint):
+    width = SIMHASH_BITS // SIMHASH_BANDS
+    mask = (1 << width) - 1
+    return [(fingerprint >> (i * width)) & mask for i in range(SIMHASH_BANDS)]
+
+
+def _to_signed(fingerprint):
+    # SQLite integers are signed 64-bit.
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+class NearDuplicateIndex:
+    def __init__(self, db_path="outputs/document_store/fingerprints.db"):
+        """
+        Persistent SimHash index of stored documents.
+
+        Args:
+            db_path (str): SQLite file holding one fingerprint per document id.
+        """
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        band_columns = ", ".join(f"band{i} INTEGER NOT NULL" for i in range(SIMHASH_BANDS))
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                doc_id TEXT PRIMARY KEY,
+                simhash INTEGER NOT NULL,
+                {band_columns}
+            )
+        """)
+        for i in range(SIMHASH_BANDS):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS fingerprints_band{i} ON fingerprints (band{i})")
+        self.conn.commit()
+
+    def find(self, fingerprint):
+        """Returns the id of a stored near-duplicate of `fingerprint`, or None."""
+        if fingerprint is None:
+            return None
+        conditions = " OR ".join(f"band{i} = ?" for i in range(SIMHASH_BANDS))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT doc_id, simhash FROM fingerprints WHERE {conditions}", _bands(fingerprint)
+            ).fetchall()
+        for doc_id, candidate in rows:
+            if bin((candidate & (1 << 64) - 1) ^ fingerprint).count("1") <= MAX_HAMMING_DISTANCE:
+                return doc_id
+        return None
+
+    def add(self, doc_id, fingerprint):
+        if fingerprint is None:
+            return
+        with self._lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO fingerprints VALUES (?, ?, {', '.join('?' * SIMHASH_BANDS)})",
+                (doc_id, _to_signed(fingerprint), *_bands(fingerprint)),
+            )
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
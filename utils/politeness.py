@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mean "slow down" rather than "this page is broken".
+THROTTLE_STATUSES = {429, 503}
+ROBOTS_USER_AGENT = "*"
+
+
+def get_host(url):
+    return urlsplit(url if "://" in url else "http://" + url).netloc.lower()
+
+
+def parse_retry_after(value, max_delay=300):
+    """Parses a Retry-After header (seconds or HTTP date) into a delay in seconds."""
+    if not value:
+        return None
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            delay = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(delay, 0.0), max_delay)
+
+
+def interleave_by_host(tasks, url_of=lambda task: task[0]):
+    """
+    Orders tasks round-robin across hosts, so consecutive tasks hit different
+    hosts and a clustered result list does not queue up behind one domain.
+    """
+    by_host = OrderedDict()
+    for task in tasks:
+        by_host.setdefault(get_host(url_of(task)), []).append(task)
+    queues = [iter(host_tasks) for host_tasks in by_host.values()]
+    ordered = []
+    while queues:
+        remaining = []
+        for host_tasks in queues:
+            task = next(host_tasks, None)
+            if task is not None:
+                ordered.append(task)
+                remaining.append(host_tasks)
+        queues = remaining
+    return ordered
+
+
+class HostBucket:
+    def __init__(self, rate, burst, min_rate, max_rate, increase, decrease):
+        """
+        Token bucket for one host whose refill rate adapts AIMD-style:
+        every success adds `increase` requests/s, every throttling response
+        multiplies the rate by `decrease`.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, consume=True):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    if consume:
+                        self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, retry_after=None):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        self.tokens = 0
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class PolitenessScheduler:
+    def __init__(
+        self,
+        rate=1.0,
+        burst=2,
+        min_rate=0.05,
+        max_rate=4.0,
+        increase=0.1,
+        decrease=0.5,
+        respect_robots=True,
+        robots_ttl=24 * 3600,
+    ):
+        """
+        Per-host politeness for the async fetcher.
+
+        Every host gets its own token bucket, so requests to different hosts
+        proceed in parallel while no single host sees more than its current
+        rate. 429/503 responses halve the host's rate and honour Retry-After;
+        successes raise it again step by step. robots.txt is fetched once per
+        host and cached, and its Crawl-delay caps the host's rate.
+
+        Args:
+            rate (float): Initial requests per second per host.
+            burst (int): Requests a host may receive back to back.
+            min_rate (float): Lower bound for the adaptive rate.
+            max_rate (float): Upper bound for the adaptive rate.
+            increase (float): Rate added after each successful request.
+            decrease (float): Factor applied to the rate on throttling.
+            respect_robots (bool): Skip URLs disallowed by robots.txt.
+            robots_ttl (float): Seconds a fetched robots.txt stays valid.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.respect_robots = respect_robots
+        self.robots_ttl = robots_ttl
+        self.buckets = {}
+        self.robots = {}
+        self.robots_locks = {}
+
+    def bucket(self, url):
+        host = get_host(url)
+        if host not in self.buckets:
+            self.buckets[host] = HostBucket(
+                self.rate, self.burst, self.min_rate, self.max_rate, self.increase, self.decrease
+            )
+        return self.buckets[host]
+
+    async def acquire(self, url):
+        """Waits until the host of `url` may receive another request and takes its token."""
+        await self.bucket(url).acquire()
+
+    async def wait_ready(self, url):
+        """Waits until the host of `url` has a token available, without taking it."""
+        await self.bucket(url).acquire(consume=False)
+
+    def record(self, url, status, retry_after=None):
+        """Feeds a response status back into the host's adaptive rate."""
+        bucket = self.bucket(url)
+        if status in THROTTLE_STATUSES:
+            delay = parse_retry_after(retry_after)
+            logger.warning(f"Throttled by {get_host(url)} ({status}); rate now {bucket.rate * self.decrease:.2f}/s")
+            bucket.on_throttle(delay)
+        elif status is not None and status < 400:
+            bucket.on_success()
+
+    async def allowed(self, url, session):
+        """Checks robots.txt for `url`, fetching and caching it on first use per host."""
+        if not self.respect_robots:
+            return True
+        parts = urlsplit(url)
+        host = parts.netloc.lower()
+        lock = self.robots_locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            entry = self.robots.get(host)
+            if entry is None or time.monotonic() - entry[1] > self.robots_ttl:
+                entry = (await self._fetch_robots(f"{parts.scheme}://{parts.netloc}/robots.txt", session), time.monotonic())
+                self.robots[host] = entry
+                parser = entry[0]
+                delay = parser.crawl_delay(ROBOTS_USER_AGENT) if parser else None
+                if delay:
+                    bucket = self.bucket(url)
+                    bucket.max_rate = min(bucket.max_rate, 1.0 / float(delay))
+                    bucket.rate = min(bucket.rate, bucket.max_rate)
+        parser = entry[0]
+        return parser is None or parser.can_fetch(ROBOTS_USER_AGENT, url)
+
+    @staticmethod
+    async def _fetch_robots(robots_url, session):
+        # Missing or unreachable robots.txt allows everything.
+        try:
+            async with session.get(robots_url, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                if response.status != 200:
+                    return None
+                text = await response.text(errors="replace")
+        except Exception:
+            return None
+        parser = RobotFileParser()
+        parser.parse(text.splitlines())
+        return parser
@@ -0,0 +1,198 @@
+import json
+
+from utils.llm_cache import request_key
+
+
+# Structured output of a batched request: one entry per claim of the batch.
+BATCH_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "claim_id": {"type": "integer"},
+            "questions": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["claim_id", "questions"],
+    },
+}
+# Line of prompt_2Q.txt after which the single claim is filled in.
+SINGLE_CLAIM_MARKER = "Now, please extract facts for the following claim as JSON list:"
+BATCH_INSTRUCTIONS = (
+    "Now, please extract facts for each of the following claims. Answer with a JSON array "
+    "that contains exactly one object per claim: {\"claim_id\": <the Claim ID>, \"questions\": "
+    "<the JSON list of facts for that claim>}.\n"
+)
+# Rough size of a token for budgeting prompts and responses.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def response_text(response):
+    """Text of a response, or None for a failed request or a blocked answer."""
+    if response is None:
+        return None
+    try:
+        return response.text
+    except ValueError:
+        return None
+
+
+def build_batch_prompt(template, claims):
+    """
+    Packs several claims into one prompt that reuses the instructions and
+    examples of the single-claim `template`.
+
+    Args:
+        template (str): Contents of prompts/prompt_2Q.txt.
+        claims (list): (claim_id, claim) pairs.
+    """
+    instructions = template.split(SINGLE_CLAIM_MARKER)[0].rstrip()
+    entries = "\n".join(f"Claim ID: {claim_id}\nClaim: {claim}\n" for claim_id, claim in claims)
+    return f"{instructions}\n\n{BATCH_INSTRUCTIONS}\n{entries}"
+
+
+def parse_batch_response(text, expected_ids):
+    """
+    Validated questions of a batched response.
+
+    Returns:
+        dict: {claim_id: [question, ...]} for every expected claim that came back
+              with a non-empty list of strings; missing or malformed entries are left out.
+    """
+    try:
+        entries = json.loads(text)
+    except (TypeError, json.JSONDecodeError):
+        return {}
+    if not isinstance(entries, list):
+        return {}
+    answered = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            claim_id = int(entry.get("claim_id"))
+        except (TypeError, ValueError):
+            continue
+        questions = entry.get("questions")
+        if claim_id not in expected_ids or claim_id in answered:
+            continue
+        if isinstance(questions, list) and questions and all(isinstance(q, str) and q.strip() for q in questions):
+            answered[claim_id] = questions
+    return answered
+
+
+def complete_batch_validator(expected_ids):
+    """Accepts a batched response only if it answers every claim in `expected_ids`."""
+    expected_ids = set(expected_ids)
+    return lambda text: len(parse_batch_response(text, expected_ids)) == len(expected_ids)
+
+
+class BatchQuestionGenerator:
+    def __init__(self, api, template, batch_size=8, min_batch_size=1, max_batch_size=32,
+                 output_token_budget=8192, tokens_per_answer=150, max_rounds=3):
+        """
+        Generates search questions for many claims with one request per batch
+        of claims instead of one per claim.
+
+        Batches are sent concurrently in rounds. Claims that come back missing
+        or malformed are sent again in the next round, bypassing the response
+        cache. Every answered claim is also cached on its own, so a rerun only
+        sends the claims that are still unanswered, however they end up batched;
+        within a prompt, claims are numbered by their position in the batch.
+        The batch size shrinks
+        by half after a batch with missing answers and grows by one after a
+        complete one, and it never exceeds what fits into the output token budget
+        at the observed answer length.
+
+        Args:
+            api (GeminiAPI): Client created with response_schema=BATCH_RESPONSE_SCHEMA.
+            template (str): Contents of prompts/prompt_2Q.txt.
+            batch_size (int): Initial claims per request.
+            min_batch_size (int): Lower bound of the batch size.
+            max_batch_size (int): Upper bound of the batch size.
+            output_token_budget (int): Maximum output tokens of one response.
+            tokens_per_answer (float): Initial estimate of output tokens per claim.
+            max_rounds (int): Attempts per claim before giving up on it.
+        """
+        self.api = api
+        self.template = template
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.output_token_budget = output_token_budget
+        self.tokens_per_answer = tokens_per_answer
+        self.max_rounds = max_rounds
+        self.requests = 0
+
+    def _budget_batch_size(self):
+        # Leave a fifth of the output budget as headroom for long answers.
+        fits = int(0.8 * self.output_token_budget / self.tokens_per_answer)
+        return max(self.min_batch_size, min(self.batch_size, self.max_batch_size, fits))
+
+    def _observe(self, response, text, answered):
+        if not answered:
+            return
+        usage = getattr(response, "usage_metadata", None)
+        output_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+        if not output_tokens:
+            output_tokens = estimate_tokens(text)
+        # Moving average of the answer length per claim.
+        self.tokens_per_answer = 0.7 * self.tokens_per_answer + 0.3 * output_tokens / len(answered)
+
+    def _claim_key(self, claim):
+        # Cache key of one claim's questions, independent of the batch it was answered in.
+        config = dict(self.api.cache_config, per_claim=True)
+        return request_key(self.api.model_name, config, build_batch_prompt(self.template, [(1, claim)]))
+
+    def generate(self, claims):
+        """
+        Args:
+            claims (list): Claim texts.
+
+        Returns:
+            list: Questions per claim, in the order of `claims`; None for claims
+                  that were not answered within max_rounds.
+        """
+        questions = [None] * len(claims)
+        for i, claim in enumerate(claims):
+            cached = self.api.cache.get(self._claim_key(claim))
+            if cached is not None:
+                questions[i] = json.loads(cached)
+        pending = [i for i, claim_questions in enumerate(questions) if claim_questions is None]
+        for round_number in range(self.max_rounds):
+            if not pending:
+                break
+            size = self._budget_batch_size()
+            batches = [pending[start:start + size] for start in range(0, len(pending), size)]
+            prompts = [
+                build_batch_prompt(self.template, [(position, claims[i]) for position, i in enumerate(batch, 1)])
+                for batch in batches
+            ]
+            self.requests += len(prompts)
+            missing = []
+            complete = True
+            responses = self.api.get_llm_responses(
+                prompts,
+                validate=[complete_batch_validator(range(1, len(batch) + 1)) for batch in batches],
+                refresh=round_number > 0,
+            )
+            for batch, response in zip(batches, responses):
+                text = response_text(response)
+                answered = parse_batch_response(text, set(range(1, len(batch) + 1)))
+                self._observe(response, text, answered)
+                for position, i in enumerate(batch, 1):
+                    if position in answered:
+                        questions[i] = answered[position]
+                        self.api.cache.put(self._claim_key(claims[i]), self.api.model_name, json.dumps(questions[i]))
+                    else:
+                        missing.append(i)
+                complete = complete and len(answered) == len(batch)
+            if complete:
+                self.batch_size = min(self.batch_size + 1, self.max_batch_size)
+            else:
+                self.batch_size = max(self.batch_size // 2, self.min_batch_size)
+            pending = missing
+        return questions
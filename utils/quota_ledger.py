@@ -0,0 +1,154 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from utils.rate_limiter import quota_day
+
+
+# Per-second usage older than this is pruned; only the last minute is read.
+PRUNE_AFTER_SECONDS = 3600
+
+
+def key_id(api_key):
+    """Stable identifier of an API key that does not store the key itself."""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+class QuotaLedger:
+    def __init__(self, path="outputs/quota_ledger.db"):
+        """
+        Request and token usage per API key, shared by every process on the
+        node and kept across restarts.
+
+        Usage is stored per key and second (for the sliding per-minute window)
+        and per key and quota day. Reservations check the limits and record the
+        request in one IMMEDIATE transaction of a WAL-mode SQLite database, so
+        concurrent processes cannot overrun a key together.
+
+        Args:
+            path (str): Path of the ledger database.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS minute_usage (
+                key TEXT NOT NULL,
+                second INTEGER NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (key, second)
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_usage (
+                key TEXT NOT NULL,
+                day TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (key, day)
+            )
+        """)
+        self._last_prune = 0.0
+
+    def _add(self, key, second, day, requests, tokens):
+        self.conn.execute(
+            "INSERT INTO minute_usage (key, second, requests, tokens) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key, second) DO UPDATE SET requests = requests + excluded.requests, "
+            "tokens = tokens + excluded.tokens",
+            (key, second, requests, tokens),
+        )
+        self.conn.execute(
+            "INSERT INTO daily_usage (key, day, requests, tokens) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (key, day) DO UPDATE SET requests = requests + excluded.requests, "
+            "tokens = tokens + excluded.tokens",
+            (key, day, requests, tokens),
+        )
+
+    def _usage(self, key, now, day):
+        minute_requests, minute_tokens, oldest = self.conn.execute(
+            "SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(tokens), 0), MIN(second) "
+            "FROM minute_usage WHERE key = ? AND second > ?",
+            (key, int(now) - 60),
+        ).fetchone()
+        day_row = self.conn.execute(
+            "SELECT requests, tokens FROM daily_usage WHERE key = ? AND day = ?", (key, day)
+        ).fetchone()
+        day_requests, day_tokens = day_row or (0, 0)
+        return minute_requests, minute_tokens, oldest, day_requests, day_tokens
+
+    def reserve(self, api_key, requests_per_minute, requests_per_day, tokens_per_minute=None, tokens_per_day=None):
+        """
+        Records one request for `api_key` if it is within all of its limits.
+
+        Returns:
+            float: 0 if the request was recorded, otherwise the seconds until the
+                   per-minute window has room again, or inf once a daily limit is reached.
+        """
+        key = key_id(api_key)
+        with self._lock:
+            now = time.time()
+            day = quota_day()
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                minute_requests, minute_tokens, oldest, day_requests, day_tokens = self._usage(key, now, day)
+                if day_requests >= requests_per_day or (tokens_per_day and day_tokens >= tokens_per_day):
+                    wait = float("inf")
+                elif minute_requests >= requests_per_minute or (tokens_per_minute and minute_tokens >= tokens_per_minute):
+                    wait = max(oldest + 61 - now, 0.05)
+                else:
+                    self._add(key, int(now), day, 1, 0)
+                    wait = 0.0
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            if now - self._last_prune > 60:
+                self._last_prune = now
+                self.conn.execute("DELETE FROM minute_usage WHERE second < ?", (int(now) - PRUNE_AFTER_SECONDS,))
+        return wait
+
+    def record_tokens(self, api_key, tokens):
+        """Adds the tokens of a finished request to the key's usage."""
+        if not tokens:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._add(key_id(api_key), int(time.time()), quota_day(), 0, int(tokens))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def exhaust(self, api_key, requests_per_day):
+        """Marks today's request quota of a key as used up, e.g. after the API said so."""
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO daily_usage (key, day, requests, tokens) VALUES (?, ?, ?, 0) "
+                "ON CONFLICT (key, day) DO UPDATE SET requests = MAX(requests, excluded.requests)",
+                (key_id(api_key), quota_day(), requests_per_day),
+            )
+
+    def usage(self, api_key):
+        """
+        Returns:
+            dict: Requests and tokens of the key in the last minute and today.
+        """
+        with self._lock:
+            minute_requests, minute_tokens, _, day_requests, day_tokens = self._usage(
+                key_id(api_key), time.time(), quota_day()
+            )
+        return {
+            "minute_requests": minute_requests,
+            "minute_tokens": minute_tokens,
+            "day_requests": day_requests,
+            "day_tokens": day_tokens,
+        }
+
+    def close(self):
+        self.conn.close()
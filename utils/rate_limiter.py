@@ -0,0 +1,209 @@
+import datetime
+import random
+import threading
+import time
+
+try:
+    from zoneinfo import ZoneInfo
+    QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
+except Exception:
+    QUOTA_TIMEZONE = datetime.timezone.utc
+
+
+class QuotaExhaustedError(RuntimeError):
+    """Raised when every API key has used up its daily request quota."""
+
+
+def quota_day():
+    """The current quota day; Gemini daily quotas reset at midnight Pacific time."""
+    return datetime.datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+
+class KeyBucket:
+    def __init__(self, requests_per_minute, requests_per_day, burst=None):
+        """
+        Token bucket for the per-minute rate of one API key plus a counter for
+        its daily quota.
+
+        Args:
+            requests_per_minute (float): Sustained request rate of the key.
+            requests_per_day (int): Daily request quota of the key.
+            burst (int, optional): Requests that may be sent back to back.
+                                   Defaults to a fifth of the per-minute rate.
+        """
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, int(requests_per_minute // 5))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.requests_per_day = requests_per_day
+        self.day = quota_day()
+        self.day_count = 0
+        # Health of the key: consecutive failures and the time it is disabled until.
+        self.failures = 0
+        self.disabled_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        day = quota_day()
+        if day != self.day:
+            self.day, self.day_count = day, 0
+
+    def wait_time(self, now):
+        """Seconds until the key may send a request; inf once its daily quota is used."""
+        self._refill(now)
+        if self.day_count >= self.requests_per_day:
+            return float("inf")
+        if now < self.disabled_until:
+            return self.disabled_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+        self.day_count += 1
+
+    def refund(self):
+        """Gives back a request that was taken but never sent."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+        self.day_count = max(self.day_count - 1, 0)
+
+
+class KeyRateLimiter:
+    def __init__(self, keys, requests_per_minute, requests_per_day, burst=None,
+                 ledger=None, tokens_per_minute=None, tokens_per_day=None):
+        """
+        Thread-safe scheduler spreading requests over several API keys, each
+        limited by its own KeyBucket.
+
+        With a QuotaLedger, a key is only used once the ledger also confirms
+        room in its per-minute and per-day request and token limits, counting
+        the usage of every other process and of earlier runs.
+
+        Args:
+            keys (list): API keys.
+            requests_per_minute (float): Per-key request rate.
+            requests_per_day (int): Per-key daily quota.
+            burst (int, optional): Per-key burst size.
+            ledger (QuotaLedger, optional): Usage shared across processes and restarts.
+            tokens_per_minute (int, optional): Per-key token limit per minute, checked by the ledger.
+            tokens_per_day (int, optional): Per-key token limit per day, checked by the ledger.
+        """
+        self.keys = list(keys)
+        self.buckets = {key: KeyBucket(requests_per_minute, requests_per_day, burst) for key in self.keys}
+        self.requests_per_minute = requests_per_minute
+        self.requests_per_day = requests_per_day
+        self.ledger = ledger
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens_per_day = tokens_per_day
+        self.condition = threading.Condition()
+        self.next_index = 0
+
+    def acquire(self, key=None, exclude=None):
+        """
+        Blocks until a key may send a request and counts the request against it.
+
+        Args:
+            key (str, optional): Wait for this key only, e.g. for an open chat session.
+            exclude (set, optional): Keys to avoid while others are usable.
+
+        Returns:
+            str: The key to use.
+
+        Raises:
+            QuotaExhaustedError: If all candidate keys used their daily quota.
+        """
+        while True:
+            with self.condition:
+                if key is not None:
+                    candidates = [key]
+                else:
+                    # Keys are tried in round-robin order, so ties go to the
+                    # key that was used longest ago.
+                    rotated = self.keys[self.next_index:] + self.keys[:self.next_index]
+                    candidates = [k for k in rotated if not exclude or k not in exclude] or rotated
+                now = time.monotonic()
+                waits = {k: self.buckets[k].wait_time(now) for k in candidates}
+                best = min(candidates, key=waits.get)
+                if waits[best] == float("inf"):
+                    raise QuotaExhaustedError("Daily request quota used up on all API keys.")
+                if waits[best] != 0:
+                    self.condition.wait(waits[best])
+                    continue
+                ready = next(k for k in candidates if waits[k] == 0)
+                self.buckets[ready].take()
+                self.next_index = (self.keys.index(ready) + 1) % len(self.keys)
+
+            # The ledger may wait on other processes for its database lock, so
+            # it is asked without holding the condition.
+            ledger_wait = self._reserve(ready)
+            if ledger_wait == 0:
+                return ready
+            with self.condition:
+                bucket = self.buckets[ready]
+                bucket.refund()
+                if ledger_wait == float("inf"):
+                    bucket.day_count = max(bucket.day_count, bucket.requests_per_day)
+                else:
+                    bucket.disabled_until = max(bucket.disabled_until, time.monotonic() + ledger_wait)
+                self.condition.notify_all()
+
+    def _reserve(self, key):
+        if self.ledger is None:
+            return 0.0
+        return self.ledger.reserve(
+            key, self.requests_per_minute, self.requests_per_day, self.tokens_per_minute, self.tokens_per_day
+        )
+
+    def record_tokens(self, key, tokens):
+        if self.ledger is not None:
+            self.ledger.record_tokens(key, tokens)
+
+    def report_success(self, key):
+        with self.condition:
+            self.buckets[key].failures = 0
+
+    def report_failure(self, key, base_delay=2.0, max_delay=300.0):
+        """
+        Disables a key for a jittered, exponentially growing cooldown after a
+        failed request; requests move to the other keys meanwhile.
+
+        Returns:
+            float: The cooldown in seconds.
+        """
+        with self.condition:
+            bucket = self.buckets[key]
+            bucket.failures += 1
+            cooldown = min(max_delay, base_delay * 2 ** (bucket.failures - 1)) * random.uniform(0.5, 1.0)
+            bucket.disabled_until = max(bucket.disabled_until, time.monotonic() + cooldown)
+            self.condition.notify_all()
+            return cooldown
+
+    def disable(self, key, seconds):
+        """Takes a key out of rotation, e.g. after it was rejected as invalid."""
+        with self.condition:
+            bucket = self.buckets[key]
+            bucket.disabled_until = max(bucket.disabled_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+    def exhaust(self, key):
+        """Marks the daily quota of a key as used up, as reported by the API."""
+        with self.condition:
+            bucket = self.buckets[key]
+            bucket.day_count = max(bucket.day_count, bucket.requests_per_day)
+            self.condition.notify_all()
+        if self.ledger is not None:
+            self.ledger.exhaust(key, self.requests_per_day)
+
+    def remaining_today(self):
+        """Requests left today, summed over all keys."""
+        if self.ledger is not None:
+            return sum(
+                max(self.requests_per_day - self.ledger.usage(key)["day_requests"], 0) for key in self.keys
+            )
+        with self.condition:
+            now = time.monotonic()
+            for bucket in self.buckets.values():
+                bucket._refill(now)
+            return sum(max(bucket.requests_per_day - bucket.day_count, 0) for bucket in self.buckets.values())
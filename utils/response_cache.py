@@ -0,0 +1,195 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from utils.cache_budget import CacheBudget
+
+
+# Query parameters that only track the visitor and never change the page.
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_src"}
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url):
+    """
+    Normalizes a URL so that trivially different spellings of the same page
+    share one cache entry: lowercases the scheme and host, drops default ports,
+    fragments and tracking parameters, and sorts the query string.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "http://" + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ]
+    path = parts.path or "/"
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+class ResponseCache:
+    def __init__(self, cache_dir="outputs/http_cache", ttl=7 * 24 * 3600, max_size_bytes=5 * 1024 ** 3):
+        """
+        Persistent on-disk cache of raw HTML responses.
+
+        Bodies are zlib-compressed and stored content-addressed by their SHA-256,
+        so identical pages served under different URLs are kept once. A SQLite
+        index maps canonical URLs to bodies together with their ETag and
+        Last-Modified validators. Entries older than `ttl` are revalidated with
+        a conditional request rather than downloaded again, and the least
+        recently used entries are evicted once the blobs exceed `max_size_bytes`.
+
+        Args:
+            cache_dir (str): Directory holding the index and the blobs.
+            ttl (float): Seconds an entry is served without revalidation.
+            max_size_bytes (int): Upper bound for the compressed blob size on disk.
+        """
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.ttl = ttl
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+        self.budget = CacheBudget(max_size_bytes, self._measure)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def get(self, url):
+        """
+        Looks up a cached response.
+
+        Returns:
+            dict or None: {'html', 'etag', 'last_modified', 'fresh'} if cached, else None.
+        """
+        key = canonicalize_url(url)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest, etag, last_modified, fetched_at FROM responses WHERE url = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            digest, etag, last_modified, fetched_at = row
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), key))
+            self.conn.commit()
+        try:
+            with open(self._blob_path(digest), "rb") as fp:
+                html = zlib.decompress(fp.read()).decode("utf-8")
+        except (OSError, zlib.error) as e:
+            print(f"Dropping unreadable cache entry for {url}: {e}", file=sys.stderr)
+            self.delete(url)
+            return None
+        return {
+            "html": html,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": time.time() - fetched_at < self.ttl,
+        }
+
+    def put(self, url, html, etag=None, last_modified=None):
+        key = canonicalize_url(url)
+        data = html.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            known = self.conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if not known:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                compressed = zlib.compress(data, 6)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, "wb") as fp:
+                    fp.write(compressed)
+                os.replace(tmp_path, path)
+                self.conn.execute("INSERT INTO blobs (digest, size) VALUES (?, ?)", (digest, len(compressed)))
+                self.budget.add(len(compressed))
+            now = time.time()
+            old = self.conn.execute("SELECT digest FROM responses WHERE url = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (url, digest, etag, last_modified, fetched_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, digest, etag, last_modified, now, now),
+            )
+            if old and old[0] != digest:
+                self.budget.add(-self._drop_orphan(old[0]))
+            self.budget.evict(
+                lambda: self.conn.execute("SELECT url, digest FROM responses ORDER BY accessed_at").fetchall(),
+                self._evict_entry,
+            )
+            self.conn.commit()
+
+    def refresh(self, url, etag=None, last_modified=None):
+        """Marks a cached entry as fresh again after a 304 Not Modified."""
+        key = canonicalize_url(url)
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (now, now, etag, last_modified, key),
+            )
+            self.conn.commit()
+
+    def delete(self, url):
+        key = canonicalize_url(url)
+        with self._lock:
+            row = self.conn.execute("SELECT digest FROM responses WHERE url = ?", (key,)).fetchone()
+            if row:
+                self.conn.execute("DELETE FROM responses WHERE url = ?", (key,))
+                self.budget.add(-self._drop_orphan(row[0]))
+                self.conn.commit()
+
+    def _measure(self):
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def size(self):
+        with self._lock:
+            return self._measure()
+
+    def _drop_orphan(self, digest):
+        """Deletes a blob no response refers to any more; returns the bytes freed."""
+        if self.conn.execute("SELECT 1 FROM responses WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+            return 0
+        row = self.conn.execute("SELECT size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        self.conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+        try:
+            os.remove(self._blob_path(digest))
+        except FileNotFoundError:
+            pass
+        return row[0] if row else 0
+
+    def _evict_entry(self, row):
+        url, digest = row
+        self.conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+        return self._drop_orphan(digest)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,117 @@
+import json
+import os
+
+
+class SearchResultsWriter:
+    def __init__(self, path="outputs/search_results.jsonl"):
+        """
+        Append-only JSONL writer for search results.
+
+        Every claim is written as one "page" record per (query, result page)
+        followed by a closing "claim" record carrying the queries and their
+        types. Appending a claim costs O(1) regardless of how many claims are
+        already stored, and a claim only counts as done once its closing record
+        is on disk, so an interrupted write is simply redone on resume.
+
+        Args:
+            path (str): The JSONL file to append to.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._truncate_partial_line()
+        self.fp = open(path, "a", encoding="utf-8")
+
+    def _truncate_partial_line(self):
+        # A crash mid-write can leave a line without its newline; drop it so the
+        # next record starts on a line of its own.
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb+") as fp:
+            fp.seek(0, os.SEEK_END)
+            size = fp.tell()
+            if size == 0:
+                return
+            fp.seek(size - 1)
+            if fp.read(1) == b"\n":
+                return
+            fp.seek(0)
+            data = fp.read()
+            fp.truncate(data.rfind(b"\n") + 1)
+
+    def _write(self, record):
+        self.fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def append_claim(self, claim, queries, results):
+        """
+        Appends all results of one claim.
+
+        Args:
+            claim (str): The claim text.
+            queries (list): (search_string, search_type) pairs for the claim.
+            results (dict): {search_string: {page_num: [result, ...]}}.
+        """
+        for query, pages in results.items():
+            for page_num, page_results in pages.items():
+                self._write({"type": "page", "claim": claim, "query": query, "page": page_num, "results": page_results})
+        self._write({"type": "claim", "claim": claim, "queries": queries})
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+
+    def close(self):
+        self.fp.close()
+
+
+def iter_claim_records(path):
+    """
+    Lazily yields (claim, queries, results) for every completed claim in a JSONL
+    file, in the order the claims were written. Results of a claim whose closing
+    record is missing (an interrupted write) are skipped.
+    """
+    pending = {}
+    with open(path, "r", encoding="utf-8") as fp:
+        for line in fp:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            claim = record["claim"]
+            if record["type"] == "page":
+                pages = pending.setdefault(claim, {}).setdefault(record["query"], {})
+                pages[str(record["page"])] = record["results"]
+            elif record["type"] == "claim":
+                results = pending.pop(claim, {})
+                # Queries without any result page still appear, like in the
+                # former search_results.json.
+                ordered = {query: results.get(query, {}) for query, _ in record["queries"]}
+                yield claim, record["queries"], ordered
+
+
+def iter_search_results(path="outputs/search_results.jsonl"):
+    """
+    Lazily yields (claim, {query: {page_num: [result, ...]}}), the same shape as
+    iterating over the former search_results.json. Legacy .json files are
+    still accepted.
+    """
+    if path.endswith(".json"):
+        with open(path, "r") as fp:
+            yield from json.load(fp).items()
+        return
+    for claim, _, results in iter_claim_records(path):
+        yield claim, results
+
+
+def find_search_results(folder="outputs"):
+    """Path of the search results in `folder`, preferring JSONL over the legacy JSON file."""
+    jsonl_path = os.path.join(folder, "search_results.jsonl")
+    json_path = os.path.join(folder, "search_results.json")
+    return jsonl_path if os.path.exists(jsonl_path) or not os.path.exists(json_path) else json_path
+
+
+def completed_claims(path="outputs/search_results.jsonl"):
+    """Claims whose results are fully stored, for resuming an interrupted run."""
+    if not os.path.exists(path):
+        return set()
+    return {claim for claim, _, _ in iter_claim_records(path)}
@@ -0,0 +1,185 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+
+from utils.batching import chunked, placeholders
+
+
+# Words, and numbers with their decimal/thousands separators ("54", "2,500", "3.5").
+TOKEN_PATTERN = re.compile(r"[0-9]+(?:[.,][0-9]+)*|[^\W\d_]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the to was were will with".split()
+)
+
+
+def tokenize(text):
+    """Lowercased terms of a text; numbers are kept whole so "54 billion" matches exactly."""
+    return [
+        token.replace(",", "") for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOP_WORDS
+    ]
+
+
+class BM25Index:
+    def __init__(self, root, k1=1.2, b=0.75):
+        """
+        Incrementally updatable BM25 index over the chunks stored in the vector store.
+
+        Postings are (term, claim_id, doc, tf) rows of a WITHOUT ROWID table, so a
+        claim-filtered lookup of a term is one index range scan; chunk texts are
+        not stored again. Document count and total length are kept in a stats
+        row that is updated together with the postings.
+
+        Args:
+            root (str): Directory of the index database.
+            k1 (float): BM25 term frequency saturation.
+            b (float): BM25 length normalization.
+        """
+        self.k1 = k1
+        self.b = b
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "bm25.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                doc INTEGER PRIMARY KEY,
+                id TEXT UNIQUE NOT NULL,
+                claim_id TEXT,
+                document_id TEXT,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS docs_claim ON docs (claim_id, document_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                claim_id TEXT,
+                doc INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, claim_id, doc)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+            CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 0), docs INTEGER, length INTEGER);
+            INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def _key(value):
+        # Same convention as LocalVectorStore: claim ids compare as strings.
+        return None if value is None else str(value)
+
+    def __len__(self):
+        return self.conn.execute("SELECT docs FROM stats").fetchone()[0]
+
+    def existing_ids(self, ids):
+        existing = set()
+        with self._lock:
+            for batch in chunked(ids):
+                existing.update(point_id for point_id, in self.conn.execute(
+                    f"SELECT id FROM docs WHERE id IN ({placeholders(batch)})", batch
+                ))
+        return existing
+
+    def _remove_docs(self, docs):
+        for batch in chunked(docs):
+            params = placeholders(batch)
+            count, length = self.conn.execute(
+                f"SELECT COUNT(*), TOTAL(length) FROM docs WHERE doc IN ({params})", batch
+            ).fetchone()
+            self.conn.execute(f"DELETE FROM postings WHERE doc IN ({params})", batch)
+            self.conn.execute(f"DELETE FROM docs WHERE doc IN ({params})", batch)
+            self.conn.execute("UPDATE stats SET docs = docs - ?, length = length - ?", (count, int(length)))
+
+    def add(self, ids, texts, metadatas):
+        """Indexes chunks, replacing any earlier version of the same ids."""
+        with self._lock:
+            replaced = []
+            for batch in chunked(ids):
+                replaced.extend(doc for doc, in self.conn.execute(
+                    f"SELECT doc FROM docs WHERE id IN ({placeholders(batch)})", batch
+                ))
+            self._remove_docs(replaced)
+            total_length = 0
+            for point_id, text, metadata in zip(ids, texts, metadatas):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                claim_key = self._key(metadata.get("claim_id"))
+                doc = self.conn.execute(
+                    "INSERT INTO docs (id, claim_id, document_id, length) VALUES (?, ?, ?, ?)",
+                    (point_id, claim_key, metadata.get("document_id"), length),
+                ).lastrowid
+                self.conn.executemany(
+                    "INSERT INTO postings (term, claim_id, doc, tf) VALUES (?, ?, ?, ?)",
+                    [(term, claim_key, doc, tf) for term, tf in terms.items()],
+                )
+                total_length += length
+            self.conn.execute("UPDATE stats SET docs = docs + ?, length = length + ?", (len(ids), total_length))
+            self.conn.commit()
+
+    def delete_stale(self, documents):
+        """Deletes chunks of each (claim_id, document_id) pair that are not among its current ids."""
+        with self._lock:
+            stale = []
+            for (claim_id, document_id), ids in documents.items():
+                current = set(ids)
+                stale.extend(
+                    doc for doc, point_id in self.conn.execute(
+                        "SELECT doc, id FROM docs WHERE claim_id = ? AND document_id = ?",
+                        (self._key(claim_id), document_id),
+                    )
+                    if point_id not in current
+                )
+            self._remove_docs(stale)
+            self.conn.commit()
+
+    def search(self, query, k=10, claim_id=None):
+        """
+        Returns [(id, score)] of the k best BM25 matches of `query`, best first,
+        optionally restricted to one claim.
+        """
+        terms = Counter(tokenize(query))
+        if not terms:
+            return []
+        claim_key = self._key(claim_id)
+        with self._lock:
+            doc_count, total_length = self.conn.execute("SELECT docs, length FROM stats").fetchone()
+            if not doc_count:
+                return []
+            average_length = total_length / doc_count
+            scores = {}
+            for term, query_tf in terms.items():
+                df = self.conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if not df:
+                    continue
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                if claim_key is None:
+                    postings = self.conn.execute(
+                        "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.doc = p.doc WHERE p.term = ?",
+                        (term,),
+                    )
+                else:
+                    postings = self.conn.execute(
+                        "SELECT p.doc, p.tf, d.length FROM postings p JOIN docs d ON d.doc = p.doc "
+                        "WHERE p.term = ? AND p.claim_id = ?",
+                        (term, claim_key),
+                    )
+                for doc, tf, length in postings:
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[doc] = scores.get(doc, 0.0) + query_tf * idf * tf * (self.k1 + 1) / norm
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            if not top:
+                return []
+            ids = dict(self.conn.execute(
+                f"SELECT doc, id FROM docs WHERE doc IN ({placeholders(top)})", [doc for doc, _ in top]
+            ))
+        return [(ids[doc], score) for doc, score in top]
+
+    def search_many(self, queries, k=10):
+        """One search per (claim_id, text) pair; returns one result list per query."""
+        return [self.search(text, k, claim_id) for claim_id, text in queries]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+
+
+class VectorFile:
+    def __init__(self, path, dim):
+        """
+        Append-only file of float32 vectors, read through a numpy memory map.
+
+        Row numbers are stable, so an index can refer to vectors by row. Rows
+        reach the file before any index points at them; a torn row from an
+        interrupted write is cut off before the next append.
+
+        Args:
+            path (str): Path of the vector file.
+            dim (int): Dimensionality of the vectors.
+        """
+        self.path = path
+        self.dim = dim
+        self.row_bytes = 4 * dim
+        self._map = None
+        self._map_rows = 0
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        return os.path.getsize(self.path) // self.row_bytes
+
+    def append(self, vectors):
+        """Appends vectors and returns the row number of the first one."""
+        array = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        first_row = len(self)
+        if os.path.exists(self.path) and os.path.getsize(self.path) % self.row_bytes:
+            os.truncate(self.path, first_row * self.row_bytes)
+        with open(self.path, "ab") as fp:
+            fp.write(array.tobytes())
+        return first_row
+
+    def view(self):
+        """Read-only memory map of all rows, or None while the file is empty."""
+        rows = len(self)
+        if self._map is None or rows != self._map_rows:
+            # The file grew since it was mapped; map it again.
+            self._map = np.memmap(self.path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+            self._map_rows = rows
+        return self._map
+
+    def close(self):
+        self._map = None
@@ -0,0 +1,376 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+
+from utils.batching import chunked, placeholders
+from utils.vector_file import VectorFile
+
+
+class VectorStore:
+    """
+    Storage interface shared by the Qdrant server and the embedded local index.
+
+    Backends implement the id/vector level calls; add_texts and
+    similarity_search mirror the LangChain vector store calls used elsewhere
+    in the repo, so either backend can be dropped in.
+    """
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+
+    def existing_ids(self, ids: list) -> set:
+        raise NotImplementedError
+
+    def upsert(self, ids: list, vectors: list, texts: list, metadatas: list):
+        raise NotImplementedError
+
+    def get_by_ids(self, ids: list) -> dict:
+        """Returns {id: Document} for the stored ids among `ids`."""
+        raise NotImplementedError
+
+    def delete_stale(self, documents: dict):
+        """Deletes points of each (claim_id, document_id) pair that are not among its current ids."""
+        raise NotImplementedError
+
+    def search_by_vector(self, vector, k: int = 4, claim_id=None, score_threshold: float = None) -> list:
+        """Returns [(Document, score)] for the k most similar points, best first."""
+        raise NotImplementedError
+
+    def search_by_vectors(self, vectors: list, k: int = 4, claim_ids: list = None,
+                          score_threshold: float = None) -> list:
+        """
+        Runs one top-k search per vector, each optionally restricted to the
+        claim at the same position of `claim_ids`. Returns one result list per vector.
+        """
+        claim_ids = claim_ids if claim_ids is not None else [None] * len(vectors)
+        return [
+            self.search_by_vector(vector, k, claim_id, score_threshold)
+            for vector, claim_id in zip(vectors, claim_ids)
+        ]
+
+    def ensure_payload_indexes(self):
+        """Makes sure the fields used in filters are indexed."""
+
+    def add_texts(self, texts: list, metadatas: list = None, ids: list = None):
+        metadatas = metadatas or [{} for _ in texts]
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in texts]
+        self.upsert(ids, self.embeddings.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def similarity_search_with_score(self, query: str, k: int = 4, claim_id=None, score_threshold: float = None):
+        return self.search_by_vector(self.embeddings.embed_query(query), k, claim_id, score_threshold)
+
+    def similarity_search(self, query: str, k: int = 4, claim_id=None, score_threshold: float = None):
+        return [document for document, _ in self.similarity_search_with_score(query, k, claim_id, score_threshold)]
+
+
+class QdrantVectorStore(VectorStore):
+    def __init__(self, client, collection_name, embeddings, batch_size=1024,
+                 content_payload_key="page_content", metadata_payload_key="metadata"):
+        """
+        Qdrant server backend, using LangChain's payload layout so points stay
+        readable through langchain_community.vectorstores.Qdrant.
+
+        Args:
+            client (QdrantClient): Connected Qdrant client.
+            collection_name (str): Name of the collection.
+            embeddings (Embeddings): Model used for add_texts and similarity_search.
+            batch_size (int): Points per retrieve/upsert request.
+        """
+        super().__init__(embeddings)
+        self.client = client
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.content_payload_key = content_payload_key
+        self.metadata_payload_key = metadata_payload_key
+
+    def existing_ids(self, ids):
+        existing = set()
+        for start in range(0, len(ids), self.batch_size):
+            records = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=ids[start:start + self.batch_size],
+                with_payload=False,
+                with_vectors=False,
+            )
+            existing.update(str(record.id) for record in records)
+        return existing
+
+    def get_by_ids(self, ids):
+        documents = {}
+        for start in range(0, len(ids), self.batch_size):
+            records = self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=ids[start:start + self.batch_size],
+                with_payload=True,
+                with_vectors=False,
+            )
+            for record in records:
+                documents[str(record.id)] = Document(
+                    page_content=record.payload.get(self.content_payload_key, ""),
+                    metadata=record.payload.get(self.metadata_payload_key, {}),
+                )
+        return documents
+
+    def upsert(self, ids, vectors, texts, metadatas):
+        from qdrant_client.http.models import PointStruct
+
+        points = [
+            PointStruct(
+                id=point_id,
+                vector=list(vector),
+                payload={self.content_payload_key: text, self.metadata_payload_key: metadata},
+            )
+            for point_id, vector, text, metadata in zip(ids, vectors, texts, metadatas)
+        ]
+        for start in range(0, len(points), self.batch_size):
+            self.client.upsert(collection_name=self.collection_name, points=points[start:start + self.batch_size])
+
+    def ensure_payload_indexes(self, fields=None):
+        """
+        Creates payload indexes on metadata.claim_id and metadata.source if they
+        are missing, so filtered searches only visit the matching points.
+
+        Args:
+            fields (dict, optional): {metadata field: PayloadSchemaType}.
+        """
+        from qdrant_client.http.models import PayloadSchemaType
+
+        fields = fields or {"claim_id": PayloadSchemaType.INTEGER, "source": PayloadSchemaType.KEYWORD}
+        indexed = self.client.get_collection(self.collection_name).payload_schema or {}
+        for field, schema in fields.items():
+            key = f"{self.metadata_payload_key}.{field}"
+            if key not in indexed:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name, field_name=key, field_schema=schema, wait=True
+                )
+
+    def claim_filter(self, claim_id):
+        from qdrant_client.http.models import Filter, FieldCondition, MatchValue
+
+        return Filter(must=[
+            FieldCondition(key=f"{self.metadata_payload_key}.claim_id", match=MatchValue(value=claim_id))
+        ])
+
+    def delete_stale(self, documents):
+        from qdrant_client.http.models import Filter, FieldCondition, MatchValue, HasIdCondition, FilterSelector
+
+        key = self.metadata_payload_key
+        conditions = []
+        for (claim_id, document_id), ids in documents.items():
+            conditions.append(Filter(
+                must=[
+                    FieldCondition(key=f"{key}.claim_id", match=MatchValue(value=claim_id)),
+                    FieldCondition(key=f"{key}.document_id", match=MatchValue(value=document_id)),
+                ],
+                must_not=[HasIdCondition(has_id=ids)] if ids else None,
+            ))
+        if conditions:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=FilterSelector(filter=Filter(should=conditions)),
+            )
+
+    def _to_documents(self, points):
+        return [
+            (
+                Document(
+                    page_content=point.payload.get(self.content_payload_key, ""),
+                    metadata=point.payload.get(self.metadata_payload_key, {}),
+                ),
+                point.score,
+            )
+            for point in points
+        ]
+
+    def search_by_vector(self, vector, k=4, claim_id=None, score_threshold=None):
+        points = self.client.search(
+            collection_name=self.collection_name,
+            query_vector=list(vector),
+            query_filter=self.claim_filter(claim_id) if claim_id is not None else None,
+            limit=k,
+            score_threshold=score_threshold,
+            with_payload=True,
+        )
+        return self._to_documents(points)
+
+    def search_by_vectors(self, vectors, k=4, claim_ids=None, score_threshold=None):
+        from qdrant_client.http.models import SearchRequest
+
+        claim_ids = claim_ids if claim_ids is not None else [None] * len(vectors)
+        requests = [
+            SearchRequest(
+                vector=list(vector),
+                filter=self.claim_filter(claim_id) if claim_id is not None else None,
+                limit=k,
+                score_threshold=score_threshold,
+                with_payload=True,
+            )
+            for vector, claim_id in zip(vectors, claim_ids)
+        ]
+        results = []
+        for start in range(0, len(requests), self.batch_size):
+            batch = self.client.search_batch(
+                collection_name=self.collection_name, requests=requests[start:start + self.batch_size]
+            )
+            results.extend(self._to_documents(points) for points in batch)
+        return results
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(self, root, embeddings, dim):
+        """
+        Embedded exact-search index for single-node jobs, tests and benchmarks.
+
+        Unit-normalized float32 vectors are appended to a flat file that is
+        searched through a numpy memory map, so scores are cosine similarities
+        like in the Qdrant collection. Ids, texts and metadata live in SQLite
+        with an index on claim_id; a claim-filtered search only scores that
+        claim's rows, so the index needs no separate payload index setup.
+        Overwritten or deleted points leave their old vector row unused.
+
+        Args:
+            root (str): Directory holding the vectors and the metadata database.
+            embeddings (Embeddings): Model used for add_texts and similarity_search.
+            dim (int): Dimensionality of the vectors.
+        """
+        super().__init__(embeddings)
+        self.root = root
+        self.dim = dim
+        os.makedirs(root, exist_ok=True)
+        self.vectors = VectorFile(os.path.join(root, "vectors.f32"), dim)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "points.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS points (
+                id TEXT PRIMARY KEY,
+                row INTEGER NOT NULL,
+                claim_id TEXT,
+                document_id TEXT,
+                text TEXT,
+                metadata TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS points_claim ON points (claim_id, document_id)")
+        self.conn.commit()
+
+    @staticmethod
+    def _key(value):
+        # Claim ids are compared as strings so 1 and "1" filter the same way.
+        return None if value is None else str(value)
+
+    def existing_ids(self, ids):
+        existing = set()
+        with self._lock:
+            for batch in chunked(ids):
+                existing.update(point_id for point_id, in self.conn.execute(
+                    f"SELECT id FROM points WHERE id IN ({placeholders(batch)})", batch
+                ))
+        return existing
+
+    def get_by_ids(self, ids):
+        documents = {}
+        with self._lock:
+            for batch in chunked(ids):
+                for point_id, text, metadata in self.conn.execute(
+                    f"SELECT id, text, metadata FROM points WHERE id IN ({placeholders(batch)})", batch
+                ):
+                    documents[point_id] = Document(page_content=text, metadata=json.loads(metadata))
+        return documents
+
+    def upsert(self, ids, vectors, texts, metadatas):
+        if not ids:
+            return
+        array = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        array /= np.clip(np.linalg.norm(array, axis=1, keepdims=True), 1e-12, None)
+        with self._lock:
+            first_row = self.vectors.append(array)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO points (id, row, claim_id, document_id, text, metadata) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        point_id, first_row + i, self._key(metadata.get("claim_id")),
+                        metadata.get("document_id"), text, json.dumps(metadata, ensure_ascii=False),
+                    )
+                    for i, (point_id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                ],
+            )
+            self.conn.commit()
+
+    def delete_stale(self, documents):
+        with self._lock:
+            for (claim_id, document_id), ids in documents.items():
+                # The stale ids are found here rather than with NOT IN (...), whose
+                # parameter count would grow with the document.
+                stored = self.conn.execute(
+                    "SELECT id FROM points WHERE claim_id = ? AND document_id = ?", (self._key(claim_id), document_id)
+                ).fetchall()
+                current = set(ids)
+                stale = [point_id for point_id, in stored if point_id not in current]
+                for batch in chunked(stale):
+                    self.conn.execute(f"DELETE FROM points WHERE id IN ({placeholders(batch)})", batch)
+            self.conn.commit()
+
+    def search_by_vector(self, vector, k=4, claim_id=None, score_threshold=None):
+        return self.search_by_vectors([vector], k, [claim_id], score_threshold)[0]
+
+    def search_by_vectors(self, vectors, k=4, claim_ids=None, score_threshold=None):
+        queries = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        queries /= np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)
+        claim_ids = claim_ids if claim_ids is not None else [None] * len(queries)
+        groups = {}
+        for i, claim_id in enumerate(claim_ids):
+            groups.setdefault(self._key(claim_id), []).append(i)
+
+        results = [[] for _ in range(len(queries))]
+        for claim_key, positions in groups.items():
+            # Queries of the same claim share one candidate lookup and one
+            # matrix product over the claim's rows.
+            with self._lock:
+                if claim_key is None:
+                    candidates = self.conn.execute("SELECT row FROM points").fetchall()
+                else:
+                    candidates = self.conn.execute("SELECT row FROM points WHERE claim_id = ?", (claim_key,)).fetchall()
+                vectors_map = self.vectors.view()
+            if not candidates or vectors_map is None:
+                continue
+            rows = np.fromiter((row for row, in candidates), dtype=np.int64, count=len(candidates))
+            scores = vectors_map[rows] @ queries[positions].T
+            for column, position in enumerate(positions):
+                column_scores = scores[:, column]
+                if len(column_scores) <= k:
+                    top = np.argsort(-column_scores)
+                else:
+                    top = np.argpartition(-column_scores, k)[:k]
+                    top = top[np.argsort(-column_scores[top])]
+                if score_threshold is not None:
+                    top = top[column_scores[top] >= score_threshold]
+                results[position] = self._to_documents(rows[top].tolist(), column_scores[top].tolist())
+        return results
+
+    def _to_documents(self, rows, scores):
+        if not rows:
+            return []
+        with self._lock:
+            by_row = {
+                row: (text, metadata)
+                for row, text, metadata in self.conn.execute(
+                    f"SELECT row, text, metadata FROM points WHERE row IN ({placeholders(rows)})", rows
+                )
+            }
+        return [
+            (Document(page_content=by_row[row][0], metadata=json.loads(by_row[row][1])), float(score))
+            for row, score in zip(rows, scores)
+        ]
+
+    def close(self):
+        self.conn.close()
+        self.vectors.close()